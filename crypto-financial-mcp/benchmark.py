@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Offline micro-benchmarks for the CPU-bound paths of the Crypto Financial MCP server
+
+Runs parsing, aggregation and rendering on synthetic data at realistic, 10x and
+100x scales, reporting time and peak memory of each function. Never touches the
+network.
+
+    python benchmark.py                      # run and compare with the baseline
+    python benchmark.py --save-baseline      # record a new baseline
+    python benchmark.py --scales realistic --threshold 30
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+import main
+
+# Daily price rows per scale: ~1.5 years, ~15 years and ~150 years
+SCALES = {
+    "realistic": 548,
+    "10x": 5480,
+    "100x": 54800
+}
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+def make_price_response(rows: int, seed: int = 42) -> Dict:
+    """Synthetic historical-prices API response with a random-walk price"""
+    rng = random.Random(seed)
+    start = date(2010, 7, 17)
+    price = 100.0
+    data = []
+    for i in range(rows):
+        change = rng.gauss(0.002, 0.04)
+        price = max(price * (1 + change), 0.01)
+        data.append({
+            "date": (start + timedelta(days=i)).isoformat(),
+            "price": round(price, 2),
+            "volume": round(rng.uniform(1e7, 5e10), 0),
+            "market_cap": round(price * 19_000_000, 0),
+            "change_24h": round(change * 100, 2),
+            "change_7d": round(rng.gauss(1, 10), 2),
+            "change_30d": round(rng.gauss(4, 20), 2)
+        })
+    return {"data": data}
+
+def build_cases(rows: int) -> List[Tuple[str, Callable[[], Any]]]:
+    """Benchmark cases for one scale, each a (name, zero-argument callable) pair"""
+    server = main.FinancialMCPServer()
+    provider = server.provider
+
+    response = make_price_response(rows)
+    history = provider.parse_historical_price_data(response)
+    monthly = provider.calculate_monthly_returns(history)
+    start, end = history[0].date, history[-1].date
+    years = max(rows // 365, 1)
+
+    # Daily arrays and DCA schedules as backtest_dca builds them: one weekly schedule
+    # over the whole series, and a sweep of monthly schedules starting in each of
+    # the first 24 months
+    dates = np.array([d.date for d in history], dtype="datetime64[D]")
+    prices = np.array([d.price for d in history], dtype=np.float64)
+    first_month = dates[0].astype("datetime64[M]")
+    sweep_starts = np.arange(first_month, first_month + 24).astype("datetime64[D]")
+    weekly = [main.dca_schedule(dates[0], dates[-1], "weekly")]
+    sweep = [main.dca_schedule(s, dates[-1], "monthly") for s in sweep_starts[sweep_starts <= dates[-1]]]
+
+    # Rendered results come from the real tools, fed the synthetic history
+    async def historical_prices(start_date: str, end_date: str):
+        return [d for d in history if start_date <= d.date <= end_date]
+
+    provider.get_historical_bitcoin_prices = historical_prices
+    loop = asyncio.new_event_loop()
+    try:
+        simulation = loop.run_until_complete(
+            provider.simulate_bitcoin_paths(years, n_paths=10000, horizon_months=120, seed=1)
+        )
+        single_backtest = loop.run_until_complete(provider.backtest_dca(100, "weekly", start, end, 0.5))
+        sweep_end = min(dates[0] + 730, dates[-1]).item().isoformat()
+        sweep_backtests = loop.run_until_complete(
+            provider.backtest_dca(100, "monthly", start, sweep_end, 0.5, sweep_start_months=True)
+        )
+    finally:
+        provider.shutdown()
+        loop.close()
+
+    return [
+        ("parse_historical_price_data", lambda: provider.parse_historical_price_data(response)),
+        ("calculate_monthly_returns", lambda: provider.calculate_monthly_returns(history)),
+        ("format_historical_prices_response", lambda: server.format_historical_prices_response(history, start, end)),
+        ("format_monthly_returns_response", lambda: server.format_monthly_returns_response(monthly, years)),
+        ("format_current_price_response", lambda: server.format_current_price_response(history[-1])),
+        ("backtest_dca_schedules/weekly",
+         lambda: main.backtest_dca_schedules(dates, prices, weekly, 100, 0.5)),
+        ("backtest_dca_schedules/sweep_24_monthly",
+         lambda: main.backtest_dca_schedules(dates, prices, sweep, 100, 0.5)),
+        ("format_simulation_response", lambda: server.format_simulation_response(simulation)),
+        ("format_dca_backtest_response/single",
+         lambda: server.format_dca_backtest_response(single_backtest, start, end, False)),
+        ("format_dca_backtest_response/sweep",
+         lambda: server.format_dca_backtest_response(sweep_backtests, start, sweep_end, True))
+    ]
+
+def measure(func: Callable[[], Any], repeat: int, min_sample_ms: float = 20.0) -> Dict[str, float]:
+    """Median and best time per call over repeat samples, plus peak traced memory of one call
+    
+    Fast functions are called several times per sample, so every sample lasts at
+    least min_sample_ms and timer resolution and scheduling noise average out. The
+    garbage collector is paused while timing, as timeit does, since when its passes
+    run depends on everything allocated before.
+    """
+    started = time.perf_counter()
+    func()  # warm-up
+    elapsed = time.perf_counter() - started
+    number = max(int(min_sample_ms / 1000 / max(elapsed, 1e-9)), 1)
+
+    times = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(number):
+                func()
+            times.append((time.perf_counter() - started) / number)
+    finally:
+        gc.enable()
+
+    # Memory is traced in a separate run since tracemalloc slows allocation down
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "median_ms": statistics.median(times) * 1000,
+        "min_ms": min(times) * 1000,
+        "peak_kb": peak / 1024
+    }
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float,
+            min_ms: float) -> List[str]:
+    """Benchmarks whose best time or peak memory grew beyond threshold percent
+    
+    Best times are compared instead of medians since they are the least affected by
+    other load on the machine; benchmarks faster than min_ms are too noisy to gate on time.
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric in ("min_ms", "peak_kb"):
+            if metric == "min_ms" and previous[metric] < min_ms:
+                continue
+            if previous[metric] > 0 and result[metric] > previous[metric] * (1 + threshold / 100):
+                change = (result[metric] / previous[metric] - 1) * 100
+                regressions.append(f"{name} {metric}: {previous[metric]:.2f} -> {result[metric]:.2f} (+{change:.1f}%)")
+    return regressions
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="crypto-financial-mcp micro-benchmarks")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=list(SCALES),
+                        help="Fixture scales to run")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=25.0,
+                        help="Allowed regression in percent before failing")
+    parser.add_argument("--min-ms", type=float, default=0.05,
+                        help="Skip the time check for benchmarks faster than this in the baseline")
+    return parser.parse_args()
+
+def main_cli() -> int:
+    """Run the benchmarks, returning the process exit code"""
+    args = parse_args()
+    logging.getLogger("main").setLevel(logging.ERROR)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+
+    results = {}
+    print(f"{'benchmark':<52} {'rows':>8} {'median ms':>11} {'min ms':>10} {'peak KiB':>11} {'vs base':>9}")
+    for scale in args.scales:
+        rows = SCALES[scale]
+        for name, func in build_cases(rows):
+            key = f"{scale}/{name}"
+            result = measure(func, args.repeat)
+            results[key] = result
+
+            previous = baseline.get(key)
+            delta = f"{(result['min_ms'] / previous['min_ms'] - 1) * 100:+.1f}%" if previous and previous["min_ms"] else "-"
+            print(f"{key:<52} {rows:>8} {result['median_ms']:>11.3f} {result['min_ms']:>10.3f} "
+                  f"{result['peak_kb']:>11.1f} {delta:>9}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": results
+            }, f, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold, args.min_ms)
+    if regressions:
+        print(f"\nRegressions beyond {args.threshold:.0f}%:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+
+    if baseline:
+        print(f"\nNo regressions beyond {args.threshold:.0f}%")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
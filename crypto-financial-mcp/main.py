@@ -4,14 +4,21 @@ Crypto Financial MCP - Model Context Protocol server for Bitcoin financial data
 Based on Financial Datasets MCP Server
 """
 
+import argparse
 import asyncio
 import json
 import logging
+import math
 import sys
+import threading
 import os
-from typing import Any, Dict, List, Optional
-from dataclasses import dataclass
+import uuid
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from dataclasses import dataclass, field, asdict
+from concurrent.futures import ProcessPoolExecutor
 import aiohttp
+import numpy as np
 import time
 from datetime import datetime, timedelta
 
@@ -19,6 +26,39 @@ from datetime import datetime, timedelta
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Maximum size of a single line-delimited JSON message
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+def json_loads(data: bytes) -> Any:
+    """Decode a JSON message with orjson when installed, falling back to the stdlib"""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(message: Any) -> bytes:
+    """Encode a JSON message with orjson when installed, falling back to the stdlib"""
+    if orjson:
+        return orjson.dumps(message)
+    return json.dumps(message, separators=(",", ":")).encode()
+
+# Event loop time by which the request being handled must be answered, when the client set one
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+def upstream_timeout(default: float) -> float:
+    """Timeout for an upstream call: the default, capped by the remaining request deadline"""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return default
+    remaining = deadline - asyncio.get_running_loop().time()
+    if remaining <= 0:
+        raise asyncio.TimeoutError("Request deadline exceeded")
+    return min(default, remaining)
+
 @dataclass
 class BitcoinPriceData:
     """Data class for Bitcoin price information"""
@@ -40,28 +80,297 @@ class BitcoinHistoricalData:
     price_end: float
     volume_avg: float
 
+@dataclass
+class SimulationResult:
+    """Data class for Monte Carlo simulation results"""
+    n_paths: int
+    horizon_months: int
+    initial_value: float
+    seed: int
+    source_months: int
+    bands: Dict[int, List[float]]
+    final_percentiles: Dict[int, float]
+    drawdown_percentiles: Dict[int, float]
+    probability_of_loss: float
+    mean_final_value: float
+
+SIMULATION_PERCENTILES = [5, 25, 50, 75, 95]
+SIMULATION_CHUNK_SIZE = 25000
+SIMULATION_HISTOGRAM_BINS = 2048
+
+def simulate_paths_chunk(log_growth: np.ndarray, horizon: int, n_paths: int,
+                         seed: np.random.SeedSequence):
+    """Bootstrap a chunk of monthly log-growth paths (runs in a worker process)
+    
+    Returns per-month histograms of cumulative log growth, so chunks can be merged
+    into percentile bands without shipping every path back, plus the final log
+    growth and maximum drawdown of each path.
+    """
+    rng = np.random.default_rng(seed)
+    samples = rng.integers(0, len(log_growth), size=(n_paths, horizon))
+    log_paths = np.cumsum(log_growth[samples], axis=1)
+    
+    # Every month gets its own histogram range, bounded by the extreme paths
+    months = np.arange(1, horizon + 1)
+    low = months * log_growth.min()
+    width = np.maximum(months * log_growth.max() - low, 1e-12) / SIMULATION_HISTOGRAM_BINS
+    bins = ((log_paths - low) / width).astype(np.int64)
+    np.clip(bins, 0, SIMULATION_HISTOGRAM_BINS - 1, out=bins)
+    bins += (months - 1) * SIMULATION_HISTOGRAM_BINS
+    histograms = np.bincount(
+        bins.ravel(), minlength=horizon * SIMULATION_HISTOGRAM_BINS
+    ).reshape(horizon, SIMULATION_HISTOGRAM_BINS)
+    
+    running_peak = np.maximum(np.maximum.accumulate(log_paths, axis=1), 0)
+    max_drawdowns = 1 - np.exp((log_paths - running_peak).min(axis=1))
+    
+    return histograms, log_paths[:, -1].astype(np.float32), max_drawdowns.astype(np.float32)
+
+@dataclass
+class DCABacktestResult:
+    """Data class for a dollar-cost-averaging backtest"""
+    start_date: str
+    end_date: str
+    frequency: str
+    amount: float
+    fee_pct: float
+    purchases: int
+    total_invested: float
+    total_fees: float
+    units: float
+    cost_basis: float
+    final_value: float
+    return_percentage: float
+    irr_percentage: float
+    value_series: List[Dict[str, Any]] = field(default_factory=list)
+
+DCA_FREQUENCY_DAYS = {"daily": 1, "weekly": 7, "biweekly": 14}
+
+def dca_schedule(start: np.datetime64, end: np.datetime64, frequency: str) -> np.ndarray:
+    """Build the purchase dates of a DCA schedule"""
+    if frequency == "monthly":
+        months = np.arange(start.astype("datetime64[M]"), end.astype("datetime64[M]") + 1)
+        day_offset = start - start.astype("datetime64[M]").astype("datetime64[D]")
+        # Buy on the same day of every month, or on the last day of shorter months
+        month_ends = (months + 1).astype("datetime64[D]") - 1
+        dates = np.minimum(months.astype("datetime64[D]") + day_offset, month_ends)
+    else:
+        dates = np.arange(start, end + 1, DCA_FREQUENCY_DAYS[frequency], dtype="datetime64[D]")
+    
+    return dates[(dates >= start) & (dates <= end)]
+
+def backtest_dca_schedules(dates: np.ndarray, prices: np.ndarray, schedules: List[np.ndarray],
+                           amount: float, fee_pct: float) -> Dict[str, np.ndarray]:
+    """Backtest many DCA schedules at once over one daily price series
+    
+    Every schedule becomes a row of a purchases-per-day matrix, so units, cost
+    and portfolio value for all schedules come out of a few cumulative sums.
+    Purchases falling on days without a price are made on the next priced day;
+    purchases before the first or after the last priced day are dropped.
+    """
+    n_schedules, n_days = len(schedules), len(dates)
+    rows = np.concatenate([np.full(len(s), i) for i, s in enumerate(schedules)])
+    purchase_dates = np.concatenate(schedules)
+    days = np.searchsorted(dates, purchase_dates)
+    valid = (purchase_dates >= dates[0]) & (days < n_days)
+    rows, days = rows[valid], days[valid]
+    
+    buys = np.zeros((n_schedules, n_days))
+    np.add.at(buys, (rows, days), 1)
+    
+    net_amount = amount * (1 - fee_pct / 100)
+    invested = np.cumsum(buys, axis=1) * amount
+    units = np.cumsum(buys * (net_amount / prices), axis=1)
+    values = units * prices
+    
+    # Annualized IRR: the rate r where the future value of every purchase at r
+    # equals the final portfolio value, found by vectorized bisection
+    end_day = dates[-1]
+    years_held = np.zeros((n_schedules, int(buys.sum(axis=1).max(initial=0))))
+    held = np.zeros_like(years_held, dtype=bool)
+    order = np.lexsort((days, rows))
+    rows, days = rows[order], days[order]
+    positions = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    years_held[rows, positions] = (end_day - dates[days]).astype(np.float64) / 365.25
+    held[rows, positions] = True
+    
+    final_values = values[:, -1]
+    low = np.full(n_schedules, -0.9999)
+    high = np.full(n_schedules, 100.0)
+    for _ in range(100):
+        rate = (low + high) / 2
+        future_cost = (amount * np.where(held, (1 + rate[:, None]) ** years_held, 0)).sum(axis=1)
+        too_low = future_cost < final_values
+        low = np.where(too_low, rate, low)
+        high = np.where(too_low, high, rate)
+    irr = np.where(years_held.max(axis=1, initial=0) > 0, (low + high) / 2 * 100, np.nan)
+    
+    return {
+        "purchases": buys.sum(axis=1),
+        "invested": invested,
+        "units": units,
+        "values": values,
+        "irr": irr
+    }
+
+def format_irr(irr_percentage: float) -> str:
+    """Render an annualized IRR, which is undefined when nothing was held for any time"""
+    return "n/d" if math.isnan(irr_percentage) else f"{irr_percentage:+.2f}%"
+
+@dataclass
+class Subscription:
+    """Data class for a client subscription to pushed updates"""
+    subscription_id: str
+    resources: List[str]
+    min_change_pct: float
+    notify: Callable[[Dict], Awaitable[None]]
+    last_values: Dict[str, float] = field(default_factory=dict)
+
+class SubscriptionManager:
+    """Runs one shared poller per watched resource and pushes changes to subscribers"""
+    
+    def __init__(self, fetch: Callable[[str], Awaitable[Optional[Dict]]], value_key: str,
+                 notification_method: str, poll_interval: float = 15):
+        self.fetch = fetch
+        self.value_key = value_key
+        self.notification_method = notification_method
+        self.poll_interval = poll_interval
+        self.subscriptions: Dict[str, Subscription] = {}
+        self.watchers: Dict[str, Set[str]] = {}
+        self.pollers: Dict[str, asyncio.Task] = {}
+    
+    def subscribe(self, resources: List[str], min_change_pct: float,
+                  notify: Callable[[Dict], Awaitable[None]]) -> Subscription:
+        """Register a subscription, starting pollers only for resources nobody watches yet"""
+        subscription = Subscription(uuid.uuid4().hex, resources, min_change_pct, notify)
+        self.subscriptions[subscription.subscription_id] = subscription
+        
+        for resource in resources:
+            self.watchers.setdefault(resource, set()).add(subscription.subscription_id)
+            if resource not in self.pollers:
+                self.pollers[resource] = asyncio.create_task(self._poll(resource))
+        
+        return subscription
+    
+    def unsubscribe(self, subscription_id: str) -> bool:
+        """Remove a subscription, stopping pollers that have no watchers left"""
+        subscription = self.subscriptions.pop(subscription_id, None)
+        if not subscription:
+            return False
+        
+        for resource in subscription.resources:
+            watchers = self.watchers.get(resource, set())
+            watchers.discard(subscription_id)
+            if not watchers:
+                self.watchers.pop(resource, None)
+                poller = self.pollers.pop(resource, None)
+                if poller:
+                    poller.cancel()
+        
+        return True
+    
+    def unsubscribe_client(self, notify: Callable[[Dict], Awaitable[None]]) -> int:
+        """Remove every subscription owned by a disconnected client"""
+        owned = [s.subscription_id for s in self.subscriptions.values() if s.notify == notify]
+        for subscription_id in owned:
+            self.unsubscribe(subscription_id)
+        return len(owned)
+    
+    async def close(self):
+        """Cancel all pollers and drop all subscriptions"""
+        for poller in self.pollers.values():
+            poller.cancel()
+        await asyncio.gather(*self.pollers.values(), return_exceptions=True)
+        self.pollers.clear()
+        self.watchers.clear()
+        self.subscriptions.clear()
+    
+    async def _poll(self, resource: str):
+        """Fetch a resource periodically on behalf of all its subscribers"""
+        # Pollers start from the context of the subscribe request and outlive it,
+        # so its deadline must not apply to their fetches
+        request_deadline.set(None)
+        while True:
+            try:
+                payload = await self.fetch(resource)
+                if payload is not None:
+                    await self._publish(resource, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Error polling {resource}: {e}")
+            
+            await asyncio.sleep(self.poll_interval)
+    
+    async def _publish(self, resource: str, payload: Dict):
+        """Notify subscribers whose last seen value moved past their threshold"""
+        value = float(payload.get(self.value_key, 0))
+        sends = []
+        
+        for subscription_id in list(self.watchers.get(resource, ())):
+            subscription = self.subscriptions.get(subscription_id)
+            if not subscription:
+                continue
+            
+            last_value = subscription.last_values.get(resource)
+            if last_value is not None:
+                if last_value == 0:
+                    change_pct = 0 if value == 0 else float("inf")
+                else:
+                    change_pct = (value - last_value) / abs(last_value) * 100
+                if abs(change_pct) < subscription.min_change_pct or change_pct == 0:
+                    continue
+            else:
+                change_pct = 0
+            
+            subscription.last_values[resource] = value
+            sends.append(subscription.notify({
+                "jsonrpc": "2.0",
+                "method": self.notification_method,
+                "params": {
+                    "subscription_id": subscription_id,
+                    "resource": resource,
+                    "change_pct": change_pct,
+                    "data": payload
+                }
+            }))
+        
+        if sends:
+            results = await asyncio.gather(*sends, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.warning(f"Error notifying subscriber of {resource}: {result}")
+
 class FinancialDataProvider:
     """Provider for Bitcoin financial data from Financial Datasets API"""
     
     def __init__(self):
         self.session: Optional[aiohttp.ClientSession] = None
+        self.session_users = 0
         self.cache = {}
         self.cache_timeout = 300  # 5 minutes
         self.api_key = os.getenv('FINANCIAL_DATASETS_API_KEY')
+        self.process_pool: Optional[ProcessPoolExecutor] = None
         
         if not self.api_key:
             logger.warning("FINANCIAL_DATASETS_API_KEY not found in environment variables")
         
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
+        # The session is shared by concurrent tool calls and pollers, so it is
+        # only closed when the last user leaves
+        if not self.session or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        self.session_users += 1
         return self
         
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
+        self.session_users -= 1
+        if self.session and self.session_users == 0:
             await self.session.close()
+            self.session = None
     
-    async def get_current_bitcoin_price(self) -> Optional[BitcoinPriceData]:
-        """Get current Bitcoin price from Financial Datasets API"""
+    async def get_current_bitcoin_price(self, symbol: str = "BTC-USD") -> Optional[BitcoinPriceData]:
+        """Get current price for a symbol (Bitcoin by default) from Financial Datasets API"""
         if not self.session or not self.api_key:
             return None
             
@@ -72,10 +381,10 @@ class FinancialDataProvider:
                 "Content-Type": "application/json"
             }
             params = {
-                "symbol": "BTC-USD"
+                "symbol": symbol
             }
             
-            async with self.session.get(url, headers=headers, params=params, timeout=30) as response:
+            async with self.session.get(url, headers=headers, params=params, timeout=upstream_timeout(30)) as response:
                 if response.status == 200:
                     data = await response.json()
                     return self.parse_current_price_data(data)
@@ -88,6 +397,14 @@ class FinancialDataProvider:
     
     async def get_historical_bitcoin_prices(self, start_date: str, end_date: str) -> List[BitcoinPriceData]:
         """Get historical Bitcoin prices from Financial Datasets API"""
+        cache_key = f"bitcoin_daily_{start_date}_{end_date}"
+        
+        # Check cache
+        if cache_key in self.cache:
+            cache_time, cached_data = self.cache[cache_key]
+            if time.time() - cache_time < self.cache_timeout:
+                return cached_data
+        
         if not self.session or not self.api_key:
             return []
             
@@ -104,10 +421,13 @@ class FinancialDataProvider:
                 "interval": "daily"
             }
             
-            async with self.session.get(url, headers=headers, params=params, timeout=30) as response:
+            async with self.session.get(url, headers=headers, params=params, timeout=upstream_timeout(30)) as response:
                 if response.status == 200:
                     data = await response.json()
-                    return self.parse_historical_price_data(data)
+                    historical_data = self.parse_historical_price_data(data)
+                    if historical_data:
+                        self.cache[cache_key] = (time.time(), historical_data)
+                    return historical_data
                 else:
                     logger.warning(f"Financial Datasets API returned status {response.status}")
                     return []
@@ -155,10 +475,11 @@ class FinancialDataProvider:
             return []
     
     def calculate_monthly_returns(self, historical_data: List[BitcoinPriceData]) -> List[BitcoinHistoricalData]:
-        """Calculate monthly returns from historical price data"""
+        """Calculate month-over-month returns from the last price of each month"""
         monthly_data = {}
         
-        for data_point in historical_data:
+        # Chronological order, so each month's prices end with its closing price
+        for data_point in sorted(historical_data, key=lambda d: d.date):
             try:
                 date = datetime.strptime(data_point.date, '%Y-%m-%d')
                 year = date.year
@@ -183,6 +504,7 @@ class FinancialDataProvider:
         # Calculate monthly returns
         monthly_returns = []
         sorted_keys = sorted(monthly_data.keys())
+        previous_close = None
         
         for i, key in enumerate(sorted_keys):
             month_data = monthly_data[key]
@@ -190,8 +512,11 @@ class FinancialDataProvider:
             month = month_data['month']
             
             if month_data['prices']:
-                price_start = min(month_data['prices'])
-                price_end = max(month_data['prices'])
+                # A month starts at the previous month's close; the first month has
+                # no previous close, so it starts at its own first price
+                price_start = previous_close if previous_close is not None else month_data['prices'][0]
+                price_end = month_data['prices'][-1]
+                previous_close = price_end
                 volume_avg = sum(month_data['volumes']) / len(month_data['volumes'])
                 
                 # Calculate return percentage
@@ -243,6 +568,159 @@ class FinancialDataProvider:
         
         return monthly_returns
     
+    async def simulate_bitcoin_paths(self, years: int = 10, n_paths: int = 100000,
+                                     horizon_months: int = 12, initial_value: float = 1000,
+                                     seed: Optional[int] = None) -> Optional[SimulationResult]:
+        """Bootstrap forward return paths from historical monthly returns"""
+        monthly_returns = await self.get_bitcoin_monthly_returns(years)
+        if not monthly_returns:
+            return None
+        
+        n_paths = min(max(n_paths, 10000), 1000000)
+        horizon_months = min(max(horizon_months, 1), 120)
+        
+        returns = np.array([m.return_percentage for m in monthly_returns], dtype=np.float64)
+        log_growth = np.log1p(np.maximum(returns, -99.99) / 100)
+        
+        # Child seeds depend only on the root seed, so results are reproducible
+        # regardless of how many workers run the chunks
+        seed_sequence = np.random.SeedSequence(seed)
+        chunk_sizes = [SIMULATION_CHUNK_SIZE] * (n_paths // SIMULATION_CHUNK_SIZE)
+        if n_paths % SIMULATION_CHUNK_SIZE:
+            chunk_sizes.append(n_paths % SIMULATION_CHUNK_SIZE)
+        chunk_seeds = seed_sequence.spawn(len(chunk_sizes))
+        
+        if not self.process_pool:
+            self.process_pool = ProcessPoolExecutor()
+        
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(*(
+            loop.run_in_executor(self.process_pool, simulate_paths_chunk,
+                                 log_growth, horizon_months, size, chunk_seed)
+            for size, chunk_seed in zip(chunk_sizes, chunk_seeds)
+        ))
+        
+        histograms = sum(chunk[0] for chunk in chunks)
+        final_log = np.concatenate([chunk[1] for chunk in chunks])
+        max_drawdowns = np.concatenate([chunk[2] for chunk in chunks])
+        
+        # Read percentile bands off the merged histograms, using bin centers
+        months = np.arange(1, horizon_months + 1)
+        low = months * log_growth.min()
+        width = np.maximum(months * log_growth.max() - low, 1e-12) / SIMULATION_HISTOGRAM_BINS
+        cumulative = np.cumsum(histograms, axis=1) / n_paths
+        bands = {}
+        for percentile in SIMULATION_PERCENTILES:
+            bins = np.argmax(cumulative >= percentile / 100, axis=1)
+            bands[percentile] = (initial_value * np.exp(low + (bins + 0.5) * width)).tolist()
+        
+        final_values = initial_value * np.exp(final_log.astype(np.float64))
+        
+        return SimulationResult(
+            n_paths=n_paths,
+            horizon_months=horizon_months,
+            initial_value=initial_value,
+            seed=seed_sequence.entropy,
+            source_months=len(returns),
+            bands=bands,
+            final_percentiles={
+                p: float(v) for p, v in zip(SIMULATION_PERCENTILES, np.percentile(final_values, SIMULATION_PERCENTILES))
+            },
+            drawdown_percentiles={
+                p: float(v) * 100 for p, v in zip(SIMULATION_PERCENTILES, np.percentile(max_drawdowns, SIMULATION_PERCENTILES))
+            },
+            probability_of_loss=float(np.mean(final_log < 0)) * 100,
+            mean_final_value=float(final_values.mean())
+        )
+    
+    async def get_daily_price_series(self, start_date: str, end_date: str):
+        """Get the daily Bitcoin price series as sorted date and price arrays"""
+        cache_key = f"bitcoin_daily_series_{start_date}_{end_date}"
+        
+        # Check cache
+        if cache_key in self.cache:
+            cache_time, cached_data = self.cache[cache_key]
+            if time.time() - cache_time < self.cache_timeout:
+                return cached_data
+        
+        historical_data = await self.get_historical_bitcoin_prices(start_date, end_date)
+        rows = sorted({d.date[:10]: d.price for d in historical_data if d.date and d.price > 0}.items())
+        if not rows:
+            return None
+        
+        series = (
+            np.array([r[0] for r in rows], dtype="datetime64[D]"),
+            np.array([r[1] for r in rows], dtype=np.float64)
+        )
+        self.cache[cache_key] = (time.time(), series)
+        
+        return series
+    
+    async def backtest_dca(self, amount: float, frequency: str, start_date: str, end_date: str,
+                           fee_pct: float = 0, sweep_start_months: bool = False) -> List[DCABacktestResult]:
+        """Backtest a DCA schedule, or one schedule per start month when sweeping"""
+        if frequency not in DCA_FREQUENCY_DAYS and frequency != "monthly":
+            raise ValueError(f"Unsupported frequency {frequency}")
+        
+        series = await self.get_daily_price_series(start_date, end_date)
+        if series is None:
+            return []
+        dates, prices = series
+        
+        end = np.datetime64(end_date, "D")
+        if sweep_start_months:
+            first_month = np.datetime64(start_date, "M")
+            starts = np.arange(first_month, end.astype("datetime64[M]") + 1).astype("datetime64[D]")
+            starts[0] = np.datetime64(start_date, "D")
+        else:
+            starts = np.array([np.datetime64(start_date, "D")])
+        
+        schedules = [dca_schedule(start, end, frequency) for start in starts]
+        backtest = backtest_dca_schedules(dates, prices, schedules, amount, fee_pct)
+        
+        results = []
+        for i, start in enumerate(starts):
+            purchases = int(backtest["purchases"][i])
+            if not purchases:
+                continue
+            
+            invested = float(backtest["invested"][i, -1])
+            units = float(backtest["units"][i, -1])
+            final_value = float(backtest["values"][i, -1])
+            
+            value_series = []
+            if not sweep_start_months:
+                active = backtest["invested"][i] > 0
+                value_series = [
+                    {"date": str(d), "invested": float(inv), "value": float(v)}
+                    for d, inv, v in zip(dates[active], backtest["invested"][i][active], backtest["values"][i][active])
+                ]
+            
+            results.append(DCABacktestResult(
+                start_date=str(start),
+                end_date=str(dates[-1]),
+                frequency=frequency,
+                amount=amount,
+                fee_pct=fee_pct,
+                purchases=purchases,
+                total_invested=invested,
+                total_fees=invested * fee_pct / 100,
+                units=units,
+                cost_basis=invested / units if units else 0,
+                final_value=final_value,
+                return_percentage=(final_value - invested) / invested * 100,
+                irr_percentage=float(backtest["irr"][i]),
+                value_series=value_series
+            ))
+        
+        return results
+    
+    def shutdown(self):
+        """Release the simulation worker processes"""
+        if self.process_pool:
+            self.process_pool.shutdown()
+            self.process_pool = None
+    
     def get_mock_bitcoin_data(self, years: int) -> List[BitcoinHistoricalData]:
         """Get mock Bitcoin data for development/testing"""
         current_year = datetime.now().year
@@ -288,8 +766,12 @@ class FinancialMCPServer:
     
     def __init__(self):
         self.provider = FinancialDataProvider()
+        self.subscriptions = SubscriptionManager(
+            self.fetch_price_update, "price", "notifications/price"
+        )
     
-    async def handle_request(self, request: Dict) -> Dict:
+    async def handle_request(self, request: Dict,
+                             notify: Optional[Callable[[Dict], Awaitable[None]]] = None) -> Dict:
         """Handle incoming MCP requests"""
         method = request.get("method")
         params = request.get("params", {})
@@ -299,12 +781,56 @@ class FinancialMCPServer:
                 return await self.list_tools()
             elif method == "tools/call":
                 return await self.call_tool(params)
+            elif method == "subscribe":
+                return self.subscribe(params, notify)
+            elif method == "unsubscribe":
+                return self.unsubscribe(params)
             else:
                 return {"error": {"code": -32601, "message": f"Method {method} not found"}}
         except Exception as e:
             logger.error(f"Error handling request: {e}")
             return {"error": {"code": -32603, "message": str(e)}}
     
+    def subscribe(self, params: Dict, notify: Optional[Callable[[Dict], Awaitable[None]]]) -> Dict:
+        """Subscribe the client to pushed price updates"""
+        if notify is None:
+            return {"error": {"code": -32600, "message": "Subscriptions require a streaming transport"}}
+        
+        symbols = params.get("symbols")
+        if symbols is None:
+            symbols = ["BTC-USD"]
+        if not isinstance(symbols, list) or not symbols or not all(isinstance(r, str) and r for r in symbols):
+            return {"error": {"code": -32602, "message": "symbols must be a non-empty list of strings"}}
+        min_change_pct = float(params.get("min_change_pct", 0.5))
+        
+        subscription = self.subscriptions.subscribe(symbols, min_change_pct, notify)
+        
+        return {
+            "result": {
+                "subscription_id": subscription.subscription_id,
+                "symbols": symbols,
+                "min_change_pct": min_change_pct
+            }
+        }
+    
+    def unsubscribe(self, params: Dict) -> Dict:
+        """Cancel a price subscription"""
+        subscription_id = params.get("subscription_id")
+        if not self.subscriptions.unsubscribe(subscription_id):
+            return {"error": {"code": -32602, "message": f"Subscription {subscription_id} not found"}}
+        
+        return {"result": {"unsubscribed": subscription_id}}
+    
+    async def fetch_price_update(self, symbol: str) -> Optional[Dict]:
+        """Fetch the current price of a symbol for the shared poller"""
+        async with self.provider as provider:
+            price_data = await provider.get_current_bitcoin_price(symbol)
+        
+        if not price_data:
+            return None
+        
+        return {"symbol": symbol, **asdict(price_data)}
+    
     async def list_tools(self) -> Dict:
         """List available tools"""
         return {
@@ -349,6 +875,76 @@ class FinancialMCPServer:
                                 }
                             }
                         }
+                    },
+                    {
+                        "name": "simulate_bitcoin_paths",
+                        "description": "Monte Carlo simulation of future Bitcoin returns bootstrapped from historical monthly returns",
+                        "inputSchema": {
+                            "type": "object",
+                            "properties": {
+                                "years": {
+                                    "type": "integer",
+                                    "description": "Years of monthly returns to sample from",
+                                    "default": 10
+                                },
+                                "n_paths": {
+                                    "type": "integer",
+                                    "description": "Number of simulated paths (10,000 to 1,000,000)",
+                                    "default": 100000
+                                },
+                                "horizon_months": {
+                                    "type": "integer",
+                                    "description": "Simulation horizon in months (1 to 120)",
+                                    "default": 12
+                                },
+                                "initial_value": {
+                                    "type": "number",
+                                    "description": "Initial investment in USD",
+                                    "default": 1000
+                                },
+                                "seed": {
+                                    "type": "integer",
+                                    "description": "Random seed for reproducible results"
+                                }
+                            }
+                        }
+                    },
+                    {
+                        "name": "backtest_dca",
+                        "description": "Backtest a Bitcoin dollar-cost-averaging schedule over historical daily prices",
+                        "inputSchema": {
+                            "type": "object",
+                            "properties": {
+                                "amount": {
+                                    "type": "number",
+                                    "description": "Amount invested per purchase in USD"
+                                },
+                                "frequency": {
+                                    "type": "string",
+                                    "description": "Purchase frequency: daily, weekly, biweekly, monthly",
+                                    "default": "monthly"
+                                },
+                                "start_date": {
+                                    "type": "string",
+                                    "description": "Start date in YYYY-MM-DD format"
+                                },
+                                "end_date": {
+                                    "type": "string",
+                                    "description": "End date in YYYY-MM-DD format"
+                                },
+                                "fee_pct": {
+                                    "type": "number",
+                                    "description": "Fee charged on each purchase, in percent",
+                                    "default": 0
+                                },
+                                "sweep_start_months": {
+                                    "type": "boolean",
+                                    "description": "Backtest one schedule for every start month between start_date and end_date",
+                                    "default": False
+                                }
+                            },
+                            "required": ["amount", "start_date", "end_date"]
+                        }
                     }
                 ]
             }
@@ -407,6 +1003,51 @@ class FinancialMCPServer:
                     }
                 }
             
+            elif tool_name == "simulate_bitcoin_paths":
+                simulation = await provider.simulate_bitcoin_paths(
+                    years=arguments.get("years", 10),
+                    n_paths=arguments.get("n_paths", 100000),
+                    horizon_months=arguments.get("horizon_months", 12),
+                    initial_value=arguments.get("initial_value", 1000),
+                    seed=arguments.get("seed")
+                )
+                
+                return {
+                    "result": {
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": self.format_simulation_response(simulation)
+                            }
+                        ]
+                    }
+                }
+            
+            elif tool_name == "backtest_dca":
+                start_date = arguments.get("start_date")
+                end_date = arguments.get("end_date")
+                sweep_start_months = arguments.get("sweep_start_months", False)
+                
+                backtests = await provider.backtest_dca(
+                    amount=float(arguments.get("amount")),
+                    frequency=arguments.get("frequency", "monthly"),
+                    start_date=start_date,
+                    end_date=end_date,
+                    fee_pct=float(arguments.get("fee_pct", 0)),
+                    sweep_start_months=sweep_start_months
+                )
+                
+                return {
+                    "result": {
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": self.format_dca_backtest_response(backtests, start_date, end_date, sweep_start_months)
+                            }
+                        ]
+                    }
+                }
+            
             else:
                 return {"error": {"code": -32601, "message": f"Tool {tool_name} not found"}}
     
@@ -492,30 +1133,352 @@ class FinancialMCPServer:
         result += f"• Pior mês: {worst_month:+.2f}%\n"
         
         return result
+    
+    def format_simulation_response(self, simulation: Optional[SimulationResult]) -> str:
+        """Format Monte Carlo simulation response as text"""
+        if not simulation:
+            return "❌ Não foi possível simular trajetórias do Bitcoin sem retornos mensais históricos."
+        
+        result = f"🎲 **Simulação Monte Carlo do Bitcoin** ({simulation.horizon_months} meses)\n\n"
+        result += f"🔢 **Trajetórias**: {simulation.n_paths:,}\n"
+        result += f"📚 **Meses de histórico amostrados**: {simulation.source_months}\n"
+        result += f"💵 **Investimento inicial**: ${simulation.initial_value:,.2f}\n"
+        result += f"🌱 **Seed**: {simulation.seed}\n\n"
+        
+        result += f"**📈 Faixas de Percentis (P5 / P25 / P50 / P75 / P95):**\n"
+        checkpoints = sorted({m for m in (1, 3, 6, 12, 24, 36, 60, 120) if m < simulation.horizon_months} | {simulation.horizon_months})
+        for month in checkpoints:
+            values = " / ".join(f"${simulation.bands[p][month - 1]:,.0f}" for p in SIMULATION_PERCENTILES)
+            result += f"• Mês {month}: {values}\n"
+        
+        result += f"\n**🎯 Valor Final:**\n"
+        result += f"• Média: ${simulation.mean_final_value:,.2f}\n"
+        for p in SIMULATION_PERCENTILES:
+            result += f"• P{p}: ${simulation.final_percentiles[p]:,.2f}\n"
+        result += f"• Probabilidade de prejuízo: {simulation.probability_of_loss:.1f}%\n"
+        
+        result += f"\n**📉 Drawdown Máximo:**\n"
+        for p in SIMULATION_PERCENTILES:
+            result += f"• P{p}: {simulation.drawdown_percentiles[p]:.1f}%\n"
+        
+        return result
+    
+    def format_dca_backtest_response(self, backtests: List[DCABacktestResult], start_date: str,
+                                     end_date: str, sweep_start_months: bool) -> str:
+        """Format DCA backtest response as text"""
+        if not backtests:
+            return f"❌ Não foi possível fazer o backtest de DCA para o período {start_date} a {end_date}."
+        
+        if not sweep_start_months:
+            backtest = backtests[0]
+            result = f"📅 **Backtest DCA do Bitcoin** ({backtest.start_date} a {backtest.end_date})\n\n"
+            result += f"💵 **Aporte**: ${backtest.amount:,.2f} ({backtest.frequency})\n"
+            result += f"🛒 **Compras**: {backtest.purchases}\n"
+            result += f"💰 **Total investido**: ${backtest.total_invested:,.2f}\n"
+            result += f"💸 **Taxas pagas**: ${backtest.total_fees:,.2f}\n"
+            result += f"₿ **BTC acumulado**: {backtest.units:.8f}\n"
+            result += f"⚖️ **Preço médio**: ${backtest.cost_basis:,.2f}\n"
+            result += f"🏦 **Valor final**: ${backtest.final_value:,.2f}\n"
+            result += f"📈 **Retorno**: {backtest.return_percentage:+.2f}%\n"
+            result += f"📊 **TIR anualizada**: {format_irr(backtest.irr_percentage)}\n"
+            
+            step = max(len(backtest.value_series) // 10, 1)
+            result += f"\n**Evolução da carteira:**\n"
+            for point in backtest.value_series[::step]:
+                result += f"• {point['date']}: ${point['value']:,.2f} (investido ${point['invested']:,.2f})\n"
+            
+            return result
+        
+        # Scenarios without an IRR (every purchase on the last day) rank as the worst
+        ranked = sorted(backtests, key=lambda b: (not math.isnan(b.irr_percentage), b.irr_percentage))
+        irrs = sorted(b.irr_percentage for b in backtests if not math.isnan(b.irr_percentage))
+        returns = [b.return_percentage for b in backtests]
+        positive = len([r for r in returns if r > 0])
+        
+        result = f"📅 **Backtest DCA por Mês de Início** ({start_date} a {end_date})\n\n"
+        result += f"🔢 **Cenários**: {len(backtests)} (aporte ${backtests[0].amount:,.2f}, {backtests[0].frequency})\n"
+        result += f"✅ **Cenários com lucro**: {positive} ({positive / len(backtests) * 100:.1f}%)\n"
+        result += f"📈 **Retorno médio**: {sum(returns) / len(returns):+.2f}%\n"
+        result += f"📊 **TIR mediana**: {format_irr(irrs[len(irrs) // 2] if irrs else math.nan)}\n\n"
+        
+        result += f"**🏆 Melhores inícios:**\n"
+        for b in reversed(ranked[-5:]):
+            result += f"• {b.start_date}: TIR {format_irr(b.irr_percentage)}, retorno {b.return_percentage:+.2f}% (${b.total_invested:,.0f} → ${b.final_value:,.0f})\n"
+        
+        result += f"\n**⚠️ Piores inícios:**\n"
+        for b in ranked[:5]:
+            result += f"• {b.start_date}: TIR {format_irr(b.irr_percentage)}, retorno {b.return_percentage:+.2f}% (${b.total_invested:,.0f} → ${b.final_value:,.0f})\n"
+        
+        return result
 
-async def main():
-    """Main function to run the MCP server"""
-    server = FinancialMCPServer()
+class AdmissionQueue:
+    """Bounds the requests handled at once across all clients
     
-    # Read from stdin, write to stdout
-    while True:
+    Up to max_active requests run concurrently and up to max_queued more wait for a
+    slot; anything beyond that is rejected right away, so overload is answered with
+    fast errors instead of piling up tasks and memory.
+    """
+    
+    def __init__(self, max_active: int = 64, max_queued: int = 256):
+        self.capacity = max_active + max_queued
+        self.slots = asyncio.Semaphore(max_active)
+        self.admitted = 0
+    
+    def try_admit(self) -> bool:
+        """Reserve room for a request, or return False when the queue is full"""
+        if self.admitted >= self.capacity:
+            return False
+        self.admitted += 1
+        return True
+    
+    def release(self):
+        """Give back the room of a finished request"""
+        self.admitted -= 1
+
+class MessageChannel:
+    """Line-delimited JSON channel with a single writer task that coalesces flushes"""
+    
+    def __init__(self, reader: asyncio.StreamReader, write: Callable[[bytes], None],
+                 drain: Callable[[], Awaitable[None]], max_pending: int = 1000,
+                 max_in_flight: int = 64, admission: Optional[AdmissionQueue] = None):
+        self.reader = reader
+        self.write = write
+        self.drain = drain
+        self.outbox: asyncio.Queue = asyncio.Queue(max_pending)
+        # Bounds the requests a single client can have admitted, so one flooding
+        # client can't take the whole shared admission queue
+        self.max_in_flight = max_in_flight
+        self.admission = admission or AdmissionQueue()
+        # In-flight requests by JSON-RPC id, so cancellation notifications can find them
+        self.requests: Dict[Any, asyncio.Task] = {}
+    
+    async def send(self, message: Dict):
+        """Queue a message for the writer task"""
+        await self.outbox.put(json_dumps(message) + b"\n")
+    
+    async def notify(self, message: Dict):
+        """Queue a notification without waiting, dropping it if the client isn't reading
+        
+        Notifications are sent from pollers shared by every subscriber, so a full
+        outbox must not hold them up for the other clients.
+        """
         try:
-            line = await asyncio.get_event_loop().run_in_executor(None, sys.stdin.readline)
-            if not line:
-                break
+            self.outbox.put_nowait(json_dumps(message) + b"\n")
+        except asyncio.QueueFull:
+            logger.warning(f"Outbox full, dropping {message.get('method')} notification")
+    
+    async def _write_loop(self):
+        """Write every queued message, flushing once per batch instead of once per message"""
+        while True:
+            chunks = [await self.outbox.get()]
+            while not self.outbox.empty():
+                chunks.append(self.outbox.get_nowait())
             
-            request = json.loads(line.strip())
-            response = await server.handle_request(request)
+            try:
+                self.write(b"".join(chunks))
+                await self.drain()
+            except Exception as e:
+                logger.error(f"Error writing response: {e}")
+            finally:
+                for _ in chunks:
+                    self.outbox.task_done()
+    
+    async def _handle(self, server, request: Dict) -> Dict:
+        """Wait for a free slot and handle the request"""
+        async with self.admission.slots:
+            return await server.handle_request(request, self.notify)
+    
+    async def _dispatch(self, server, request: Dict):
+        """Handle one admitted request within its deadline and queue its response"""
+        try:
+            params = request.get("params")
+            meta = params.get("_meta") if isinstance(params, dict) else None
+            timeout_ms = meta.get("timeoutMs") if isinstance(meta, dict) else None
+            valid_timeout = (timeout_ms is None or (
+                isinstance(timeout_ms, (int, float)) and not isinstance(timeout_ms, bool) and timeout_ms > 0
+            ))
             
-            # Write response to stdout
-            print(json.dumps(response), flush=True)
+            try:
+                if not valid_timeout:
+                    response = {"error": {"code": -32602, "message": f"Invalid _meta.timeoutMs {timeout_ms!r}: expected a positive number"}}
+                elif timeout_ms is not None:
+                    # The deadline covers the wait for a slot and every upstream call made for the request
+                    timeout = timeout_ms / 1000
+                    request_deadline.set(asyncio.get_running_loop().time() + timeout)
+                    response = await asyncio.wait_for(self._handle(server, request), timeout)
+                else:
+                    response = await self._handle(server, request)
+            except asyncio.TimeoutError:
+                response = {"error": {"code": -32001, "message": f"Request timed out after {timeout_ms} ms"}}
             
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON: {e}")
-            continue
-        except Exception as e:
-            logger.error(f"Unexpected error: {e}")
-            continue
+            if "id" in request:
+                response = {"jsonrpc": "2.0", "id": request["id"], **response}
+            await self.send(response)
+        except asyncio.CancelledError:
+            # Cancelled requests get no response
+            logger.info(f"Request {request.get('id')} cancelled")
+    
+    def cancel(self, request_id: Any):
+        """Cancel an in-flight request on behalf of the client"""
+        task = self.requests.get(request_id)
+        if task:
+            task.cancel()
+    
+    async def reject(self, request: Dict):
+        """Answer a request that didn't fit in the admission queue"""
+        logger.warning(f"Server overloaded, rejecting {request.get('method')}")
+        if "id" in request:
+            await self.send({
+                "jsonrpc": "2.0",
+                "id": request["id"],
+                "error": {"code": -32000, "message": "Server overloaded, try again later"}
+            })
+    
+    async def serve(self, server):
+        """Read requests until EOF, handling them concurrently"""
+        writer_task = asyncio.create_task(self._write_loop())
+        pending = set()
+        
+        try:
+            while True:
+                try:
+                    line = await self.reader.readline()
+                except (ConnectionError, ValueError) as e:
+                    logger.warning(f"Closing channel: {e}")
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                
+                try:
+                    request = json_loads(line)
+                except ValueError as e:
+                    # JSONDecodeError, or UnicodeDecodeError from the stdlib on invalid UTF-8
+                    logger.error(f"Invalid JSON: {e}")
+                    continue
+                
+                if not isinstance(request, dict):
+                    logger.error(f"Invalid request, expected a JSON object: {line[:100]!r}")
+                    await self.send({
+                        "jsonrpc": "2.0",
+                        "id": None,
+                        "error": {"code": -32600, "message": "Invalid Request: expected a JSON object"}
+                    })
+                    continue
+                
+                if request.get("method") == "notifications/cancelled":
+                    self.cancel((request.get("params") or {}).get("requestId"))
+                    continue
+                
+                # Reading never blocks on busy handlers, so cancellations always get through;
+                # excess load is rejected instead
+                if len(pending) >= self.max_in_flight or not self.admission.try_admit():
+                    await self.reject(request)
+                    continue
+                
+                task = asyncio.create_task(self._dispatch(server, request))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                # Released from a callback rather than inside _dispatch, since a task
+                # cancelled before it first runs never executes its body
+                task.add_done_callback(lambda _: self.admission.release())
+                
+                request_id = request.get("id")
+                if isinstance(request_id, (str, int)):
+                    self.requests[request_id] = task
+                    task.add_done_callback(lambda _, key=request_id: self.requests.pop(key, None))
+            
+            await asyncio.gather(*pending, return_exceptions=True)
+            await self.outbox.join()
+        finally:
+            server.subscriptions.unsubscribe_client(self.notify)
+            writer_task.cancel()
+
+async def open_stdio_channel(admission: Optional[AdmissionQueue] = None) -> MessageChannel:
+    """Open a message channel over stdin/stdout"""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=MAX_MESSAGE_SIZE)
+    
+    try:
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    except (NotImplementedError, ValueError, OSError):
+        # Windows consoles and redirected files can't be watched by the event loop,
+        # so a reader thread feeds the stream instead
+        def pump_stdin():
+            for line in iter(sys.stdin.buffer.readline, b""):
+                loop.call_soon_threadsafe(reader.feed_data, line)
+            loop.call_soon_threadsafe(reader.feed_eof)
+        
+        threading.Thread(target=pump_stdin, daemon=True).start()
+    
+    async def flush_stdout():
+        sys.stdout.buffer.flush()
+    
+    return MessageChannel(reader, sys.stdout.buffer.write, flush_stdout, admission=admission)
+
+async def serve_connections(server, args: argparse.Namespace, admission: AdmissionQueue):
+    """Serve many clients over a Unix or TCP socket, sharing one server instance and admission queue"""
+    async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        channel = MessageChannel(reader, writer.write, writer.drain, admission=admission)
+        try:
+            await channel.serve(server)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+    
+    if args.transport == "unix":
+        if os.path.exists(args.socket_path):
+            os.unlink(args.socket_path)
+        listener = await asyncio.start_unix_server(
+            handle_connection, path=args.socket_path, limit=MAX_MESSAGE_SIZE
+        )
+        logger.info(f"Listening on unix socket {args.socket_path}")
+    else:
+        listener = await asyncio.start_server(
+            handle_connection, args.host, args.port, limit=MAX_MESSAGE_SIZE
+        )
+        logger.info(f"Listening on {args.host}:{args.port}")
+    
+    async with listener:
+        await listener.serve_forever()
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="crypto-financial-mcp MCP server")
+    parser.add_argument("--transport", choices=["stdio", "unix", "tcp"], default="stdio",
+                        help="stdio serves a single client; unix/tcp serve many clients from one process")
+    parser.add_argument("--socket-path", default="/tmp/crypto-financial-mcp.sock",
+                        help="Socket path for the unix transport")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address for the tcp transport")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the tcp transport")
+    parser.add_argument("--max-concurrent", type=int, default=64,
+                        help="Requests handled at once across all clients")
+    parser.add_argument("--max-queued", type=int, default=256,
+                        help="Requests waiting for a slot before new ones are rejected")
+    return parser.parse_args()
+
+async def main():
+    """Main function to run the MCP server"""
+    args = parse_args()
+    server = FinancialMCPServer()
+    
+    # Keep one shared session open for the lifetime of the process
+    async with server.provider:
+        try:
+            admission = AdmissionQueue(args.max_concurrent, args.max_queued)
+            if args.transport == "stdio":
+                # Read from stdin, write to stdout
+                channel = await open_stdio_channel(admission)
+                await channel.serve(server)
+            else:
+                await serve_connections(server, args, admission)
+        finally:
+            await server.subscriptions.close()
+            server.provider.shutdown()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Checks for the monthly return calculation, the Monte Carlo simulation and the DCA backtest
+
+    python -m unittest test_main
+"""
+
+import asyncio
+import json
+import math
+import random
+import unittest
+from datetime import date, timedelta
+
+import numpy as np
+
+import main
+
+def random_walk_prices(days: int, seed: int = 7):
+    """Daily BitcoinPriceData following a random walk with both up and down months"""
+    rng = random.Random(seed)
+    price = 10000.0
+    series = []
+    for i in range(days):
+        price *= 1 + rng.gauss(0.001, 0.04)
+        series.append(main.BitcoinPriceData(
+            date=(date(2015, 1, 1) + timedelta(days=i)).isoformat(),
+            price=price, volume=1e9, market_cap=0, change_24h=0, change_7d=0, change_30d=0
+        ))
+    return series
+
+class MonthlyReturnsTest(unittest.TestCase):
+    def test_returns_are_month_over_month_closes(self):
+        provider = main.FinancialDataProvider()
+        prices = random_walk_prices(3650)
+        # Input order must not matter
+        returns = provider.calculate_monthly_returns(list(reversed(prices)))
+
+        self.assertTrue(any(m.return_percentage < 0 for m in returns))
+        for previous, current in zip(returns, returns[1:]):
+            self.assertEqual(current.price_start, previous.price_end)
+            self.assertAlmostEqual(
+                current.return_percentage, (current.price_end / current.price_start - 1) * 100
+            )
+
+class SimulationTest(unittest.TestCase):
+    def test_probability_of_loss_with_down_months(self):
+        provider = main.FinancialDataProvider()
+        prices = random_walk_prices(3650)
+
+        async def historical_prices(start_date, end_date):
+            return prices
+
+        provider.get_historical_bitcoin_prices = historical_prices
+        try:
+            result = asyncio.run(provider.simulate_bitcoin_paths(years=10, n_paths=10000, seed=1))
+        finally:
+            provider.shutdown()
+
+        self.assertGreater(result.probability_of_loss, 0)
+        self.assertLess(result.probability_of_loss, 100)
+        self.assertGreater(result.drawdown_percentiles[95], 0)
+        self.assertLess(result.final_percentiles[5], result.initial_value)
+
+class DCABacktestTest(unittest.TestCase):
+    def test_purchases_before_the_first_price_are_dropped(self):
+        dates = np.arange(np.datetime64("2020-03-01"), np.datetime64("2020-06-01"))
+        prices = np.linspace(100, 200, len(dates))
+        schedule = main.dca_schedule(np.datetime64("2020-01-01"), dates[-1], "monthly")
+        backtest = main.backtest_dca_schedules(dates, prices, [schedule], 100, 0)
+        self.assertEqual(backtest["purchases"][0], 3)
+
+    def test_sweep_without_irr_renders(self):
+        provider = main.FinancialDataProvider()
+        prices = random_walk_prices(60)
+
+        async def historical_prices(start_date, end_date):
+            return [p for p in prices if start_date <= p.date <= end_date]
+
+        provider.get_historical_bitcoin_prices = historical_prices
+        try:
+            # Prices end on 2015-03-01, so the March start only buys on the final day
+            backtests = asyncio.run(provider.backtest_dca(100, "monthly", prices[0].date, prices[-1].date, 0,
+                                                          sweep_start_months=True))
+        finally:
+            provider.shutdown()
+
+        self.assertTrue(any(math.isnan(b.irr_percentage) for b in backtests))
+        text = main.FinancialMCPServer().format_dca_backtest_response(backtests, prices[0].date, prices[-1].date, True)
+        self.assertNotIn("nan", text)
+
+def serve_lines(channel_admission, lines):
+    """Serve one client whose requests all arrive in a single buffer, returning its responses"""
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"".join(json.dumps(line).encode() + b"\n" for line in lines))
+        reader.feed_eof()
+        written = []
+
+        async def drain():
+            pass
+
+        channel = main.MessageChannel(reader, written.append, drain, admission=channel_admission)
+        await channel.serve(main.FinancialMCPServer())
+        return [json.loads(line) for line in b"".join(written).splitlines()]
+
+    return asyncio.run(run())
+
+class AdmissionTest(unittest.TestCase):
+    def test_requests_cancelled_before_starting_release_their_slot(self):
+        admission = main.AdmissionQueue(max_active=2, max_queued=2)
+        lines = []
+        for i in range(10):
+            lines.append({"jsonrpc": "2.0", "id": i, "method": "tools/list"})
+            lines.append({"jsonrpc": "2.0", "method": "notifications/cancelled", "params": {"requestId": i}})
+
+        # Requests beyond the queue are rejected, but none is answered after its cancellation
+        responses = serve_lines(admission, lines)
+        self.assertFalse([r for r in responses if "result" in r])
+        self.assertEqual(admission.admitted, 0)
+
+        responses = serve_lines(admission, [{"jsonrpc": "2.0", "id": 99, "method": "tools/list"}])
+        self.assertEqual(responses[0]["id"], 99)
+        self.assertIn("result", responses[0])
+
+class SubscriptionTest(unittest.TestCase):
+    def test_pollers_ignore_the_deadline_of_the_subscribe_request(self):
+        deadlines = []
+
+        async def fetch(resource):
+            deadlines.append(main.request_deadline.get())
+            return None
+
+        async def notify(message):
+            pass
+
+        async def run():
+            manager = main.SubscriptionManager(fetch, "price", "notifications/test", poll_interval=0.01)
+            main.request_deadline.set(asyncio.get_running_loop().time() + 0.05)
+            manager.subscribe(["a"], 0, notify)
+            await asyncio.sleep(0.1)
+            await manager.close()
+
+        asyncio.run(run())
+        self.assertTrue(deadlines)
+        self.assertEqual(set(deadlines), {None})
+
+if __name__ == "__main__":
+    unittest.main()
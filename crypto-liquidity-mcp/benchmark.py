@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Offline micro-benchmarks for the CPU-bound paths of the Crypto Liquidity MCP server
+
+Runs parsing, merging, sorting and rendering on synthetic pools at realistic, 10x
+and 100x scales, reporting time and peak memory of each function. Never touches
+the network.
+
+    python benchmark.py                      # run and compare with the baseline
+    python benchmark.py --save-baseline      # record a new baseline
+    python benchmark.py --scales realistic --threshold 30
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import replace
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Tuple
+
+import main
+
+# Pools per network at each scale
+SCALES = {
+    "realistic": 500,
+    "10x": 5000,
+    "100x": 50000
+}
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+TOKENS = ["WETH", "USDC", "USDT", "DAI", "WBTC", "LINK", "UNI", "AAVE", "PEPE", "ARB", "OP", "MATIC"]
+DEXES = ["uniswap", "sushiswap", "pancakeswap", "curve", "balancer", "camelot"]
+
+def make_pool_records(count: int, seed: int = 42, prefix: str = "") -> List[Dict]:
+    """Synthetic DexScreener-style pair records"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        liquidity = rng.lognormvariate(11, 2)
+        volume = liquidity * rng.uniform(0.01, 2)
+        records.append({
+            "pairAddress": f"0x{prefix}{i:040x}"[-42:] if prefix else f"0x{i:040x}",
+            "dexId": rng.choice(DEXES),
+            "baseToken": {"address": f"0x{rng.getrandbits(160):040x}", "symbol": rng.choice(TOKENS) + (str(i % 97) if i % 3 else "")},
+            "quoteToken": {"address": f"0x{rng.getrandbits(160):040x}", "symbol": rng.choice(TOKENS[:4])},
+            "liquidity": {"usd": round(liquidity, 2)},
+            "volume": {"h24": round(volume, 2)},
+            "fees": {"h24": round(volume * 0.003, 2)},
+            "priceChange": {"h24": round(rng.gauss(0, 5), 2)}
+        })
+    return records
+
+def build_cases(count: int) -> List[Tuple[str, Callable[[], Any]]]:
+    """Benchmark cases for one scale, each a (name, zero-argument callable) pair"""
+    server = main.LiquidityMCPServer()
+    provider = server.provider
+    provider.cache_timeout = float("inf")
+    loop = asyncio.new_event_loop()
+    network = "ethereum"
+
+    records = make_pool_records(count)
+    # A second source reporting a third of the same pairs plus pairs of its own
+    overlap = make_pool_records(count // 3, seed=7)
+    extra = make_pool_records(count // 3, seed=8, prefix="c0")
+    gecko_records = overlap + extra
+
+    pools = provider.parse_pool_data(records, network)
+    provider.parse_pool_data_incremental(records, network, "dexscreener")
+    pools_by_source = {
+        "dexscreener": provider.parse_pool_data_incremental(records, network, "dexscreener")[0],
+        "coingecko": provider.parse_pool_data_incremental(gecko_records, network, "coingecko")[0]
+    }
+    merged = provider.merge_pools(pools_by_source)
+    merged_pools, merged_keys = list(merged.values()), list(merged)
+    snapshot = provider.build_snapshot(network, merged_pools, merged_keys, None, main.PoolChangeSet())
+    snapshot = replace(snapshot, fetched_at=time.time())
+    # A refresh where 1% of the pairs changed merges only those again
+    incremental = dict(merged)
+    churn = set(random.Random(3).sample(merged_keys, max(len(merged_keys) // 100, 1)))
+    provider.snapshots[network] = snapshot
+
+    top = snapshot.orderings["tvl"][:50]
+    matches = loop.run_until_complete(provider.search_pools_by_token("USDC", network))
+    comparison = loop.run_until_complete(provider.get_pool_comparison("WETH", network))
+
+    return [
+        ("parse_pool_data", lambda: provider.parse_pool_data(records, network)),
+        ("parse_pool_data_incremental/unchanged",
+         lambda: provider.parse_pool_data_incremental(records, network, "dexscreener")),
+        ("merge_pools", lambda: provider.merge_pools(pools_by_source)),
+        ("merge_changed_pools/1pct_churn",
+         lambda: provider.merge_changed_pools(incremental, pools_by_source, churn)),
+        ("build_snapshot/sorts+index+columns",
+         lambda: provider.build_snapshot(network, merged_pools, merged_keys, None, main.PoolChangeSet())),
+        ("sort/full_tvl", lambda: sorted(pools, key=attrgetter("tvl"), reverse=True)),
+        ("get_network_pools/precomputed",
+         lambda: loop.run_until_complete(provider.get_network_pools(network, "volume_usd", 50))),
+        ("get_network_pools/heap_top_k",
+         lambda: loop.run_until_complete(provider.get_network_pools(network, "price_change_24h", 50))),
+        ("search_pools_by_token",
+         lambda: loop.run_until_complete(provider.search_pools_by_token("USDC", network))),
+        ("format_pools_response", lambda: server.format_pools_response(top, network, "tvl")),
+        ("format_token_search_response", lambda: server.format_token_search_response(matches, "USDC", network)),
+        ("format_comparison_response", lambda: server.format_comparison_response(comparison, "WETH", network)),
+        ("format_query_response", lambda: server.format_query_response(top, len(merged_pools), "tvl"))
+    ]
+
+def measure(func: Callable[[], Any], repeat: int, min_sample_ms: float = 20.0) -> Dict[str, float]:
+    """Median and best time per call over repeat samples, plus peak traced memory of one call
+    
+    Fast functions are called several times per sample, so every sample lasts at
+    least min_sample_ms and timer resolution and scheduling noise average out. The
+    garbage collector is paused while timing, as timeit does, since when its passes
+    run depends on everything allocated before.
+    """
+    started = time.perf_counter()
+    func()  # warm-up
+    elapsed = time.perf_counter() - started
+    number = max(int(min_sample_ms / 1000 / max(elapsed, 1e-9)), 1)
+
+    times = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(number):
+                func()
+            times.append((time.perf_counter() - started) / number)
+    finally:
+        gc.enable()
+
+    # Memory is traced in a separate run since tracemalloc slows allocation down
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "median_ms": statistics.median(times) * 1000,
+        "min_ms": min(times) * 1000,
+        "peak_kb": peak / 1024
+    }
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float,
+            min_ms: float) -> List[str]:
+    """Benchmarks whose best time or peak memory grew beyond threshold percent
+    
+    Best times are compared instead of medians since they are the least affected by
+    other load on the machine; benchmarks faster than min_ms are too noisy to gate on time.
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric in ("min_ms", "peak_kb"):
+            if metric == "min_ms" and previous[metric] < min_ms:
+                continue
+            if previous[metric] > 0 and result[metric] > previous[metric] * (1 + threshold / 100):
+                change = (result[metric] / previous[metric] - 1) * 100
+                regressions.append(f"{name} {metric}: {previous[metric]:.2f} -> {result[metric]:.2f} (+{change:.1f}%)")
+    return regressions
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="crypto-liquidity-mcp micro-benchmarks")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=list(SCALES),
+                        help="Fixture scales to run")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=25.0,
+                        help="Allowed regression in percent before failing")
+    parser.add_argument("--min-ms", type=float, default=0.05,
+                        help="Skip the time check for benchmarks faster than this in the baseline")
+    return parser.parse_args()
+
+def main_cli() -> int:
+    """Run the benchmarks, returning the process exit code"""
+    args = parse_args()
+    logging.getLogger("main").setLevel(logging.ERROR)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+
+    results = {}
+    print(f"{'benchmark':<52} {'pools':>8} {'median ms':>11} {'min ms':>10} {'peak KiB':>11} {'vs base':>9}")
+    for scale in args.scales:
+        count = SCALES[scale]
+        for name, func in build_cases(count):
+            key = f"{scale}/{name}"
+            result = measure(func, args.repeat)
+            results[key] = result
+
+            previous = baseline.get(key)
+            delta = f"{(result['min_ms'] / previous['min_ms'] - 1) * 100:+.1f}%" if previous and previous["min_ms"] else "-"
+            print(f"{key:<52} {count:>8} {result['median_ms']:>11.3f} {result['min_ms']:>10.3f} "
+                  f"{result['peak_kb']:>11.1f} {delta:>9}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": results
+            }, f, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold, args.min_ms)
+    if regressions:
+        print(f"\nRegressions beyond {args.threshold:.0f}%:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+
+    if baseline:
+        print(f"\nNo regressions beyond {args.threshold:.0f}%")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
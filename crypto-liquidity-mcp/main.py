@@ -4,19 +4,61 @@ Crypto Liquidity MCP - Model Context Protocol server for liquidity pool analysis
 Based on CryptoAnalysisMCP by M-Pineapple
 """
 
+import argparse
 import asyncio
+import heapq
+import itertools
 import json
 import logging
 import sys
-from typing import Any, Dict, List, Optional
-from dataclasses import dataclass
+import os
+import threading
+import uuid
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from dataclasses import dataclass, field, fields, replace
 import aiohttp
+import numpy as np
 import time
+from operator import attrgetter
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Maximum size of a single line-delimited JSON message
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+def json_loads(data: bytes) -> Any:
+    """Decode a JSON message with orjson when installed, falling back to the stdlib"""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(message: Any) -> bytes:
+    """Encode a JSON message with orjson when installed, falling back to the stdlib"""
+    if orjson:
+        return orjson.dumps(message)
+    return json.dumps(message, separators=(",", ":")).encode()
+
+# Event loop time by which the request being handled must be answered, when the client set one
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+def upstream_timeout(default: float) -> float:
+    """Timeout for an upstream call: the default, capped by the remaining request deadline"""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return default
+    remaining = deadline - asyncio.get_running_loop().time()
+    if remaining <= 0:
+        raise asyncio.TimeoutError("Request deadline exceeded")
+    return min(default, remaining)
+
 @dataclass
 class LiquidityPool:
     """Data class for liquidity pool information"""
@@ -34,6 +76,9 @@ class LiquidityPool:
     price_change_24h: float
     pool_address: str
     pair_address: str
+    sources: List[str] = field(default_factory=list)
+
+POOL_FIELD_NAMES = [f.name for f in fields(LiquidityPool)]
 
 @dataclass
 class NetworkInfo:
@@ -44,21 +89,590 @@ class NetworkInfo:
     pool_count: int
     volume_24h: float
 
+# Sort keys accepted by get_network_pools and the pool field each one orders by
+SORT_FIELDS = {
+    "tvl": "tvl",
+    "volume_usd": "volume_24h",
+    "apy": "apy",
+    "fees_24h": "fees_24h"
+}
+
+# Pool fields reconciled when several sources report the same pair
+MERGED_POOL_FIELDS = [
+    "dex", "token0", "token1", "token0_symbol", "token1_symbol", "liquidity_usd",
+    "volume_24h", "fees_24h", "tvl", "price_change_24h", "pool_address"
+]
+
+# Numeric pool fields that can be used as ad-hoc sort keys
+NUMERIC_POOL_FIELDS = {"liquidity_usd", "volume_24h", "fees_24h", "apy", "tvl", "price_change_24h"}
+
+def normalize_address(address: str) -> str:
+    """Normalize an address for lookups (EVM hex addresses are case-insensitive)"""
+    return address.lower() if address.startswith("0x") else address
+
+def pool_record_digest(item: Dict) -> int:
+    """Hash of the raw record fields that parse_pool_item reads"""
+    base = item.get('baseToken') or {}
+    quote = item.get('quoteToken') or {}
+    return hash((
+        item.get('pairAddress'), item.get('dexId'),
+        base.get('address'), base.get('symbol'), quote.get('address'), quote.get('symbol'),
+        (item.get('liquidity') or {}).get('usd'), (item.get('volume') or {}).get('h24'),
+        (item.get('fees') or {}).get('h24'), (item.get('priceChange') or {}).get('h24')
+    ))
+
+class PoolIndex:
+    """Token and DEX lookups over a network's pool universe, built once per refresh"""
+    
+    NGRAM_SIZE = 3
+    
+    def __init__(self, pools: List[LiquidityPool]):
+        self.by_symbol: Dict[str, List[int]] = {}
+        self.by_address: Dict[str, List[int]] = {}
+        self.by_dex: Dict[str, Set[int]] = {}
+        # n-grams (every length up to NGRAM_SIZE) of each distinct symbol, for substring search
+        self.symbol_ngrams: Dict[str, Set[str]] = {}
+        
+        for i, pool in enumerate(pools):
+            for symbol in {pool.token0_symbol.upper(), pool.token1_symbol.upper()}:
+                if symbol:
+                    self.by_symbol.setdefault(symbol, []).append(i)
+            for address in {pool.token0, pool.token1, pool.pair_address}:
+                if address:
+                    self.by_address.setdefault(normalize_address(address), []).append(i)
+            self.by_dex.setdefault(pool.dex, set()).add(i)
+        
+        for symbol in self.by_symbol:
+            for gram in self.ngrams(symbol):
+                self.symbol_ngrams.setdefault(gram, set()).add(symbol)
+    
+    @classmethod
+    def ngrams(cls, text: str) -> Set[str]:
+        """All substrings of text up to NGRAM_SIZE characters long"""
+        return {
+            text[start:start + size]
+            for size in range(1, cls.NGRAM_SIZE + 1)
+            for start in range(len(text) - size + 1)
+        }
+    
+    def matching_symbols(self, query: str) -> Set[str]:
+        """Distinct symbols containing the query"""
+        if len(query) <= self.NGRAM_SIZE:
+            return self.symbol_ngrams.get(query, set())
+        
+        # Intersect the posting sets of the query's n-grams, then confirm the
+        # surviving candidates actually contain the whole query
+        grams = [query[i:i + self.NGRAM_SIZE] for i in range(len(query) - self.NGRAM_SIZE + 1)]
+        postings = sorted((self.symbol_ngrams.get(gram, set()) for gram in grams), key=len)
+        candidates = set.intersection(*postings)
+        return {symbol for symbol in candidates if query in symbol}
+    
+    def search(self, token: str) -> Set[int]:
+        """Positions of pools whose token address matches exactly or whose symbol contains the query"""
+        positions = set(self.by_address.get(normalize_address(token), ()))
+        for symbol in self.matching_symbols(token.upper()):
+            positions.update(self.by_symbol[symbol])
+        return positions
+
+# Range predicates accepted by query_pools: argument -> (column, comparison)
+QUERY_RANGE_FILTERS = {
+    "min_tvl": ("tvl", ">="),
+    "max_tvl": ("tvl", "<="),
+    "min_volume_24h": ("volume_24h", ">="),
+    "min_fees_24h": ("fees_24h", ">="),
+    "min_apy": ("apy", ">="),
+    "max_apy": ("apy", "<="),
+    "min_volume_tvl_ratio": ("volume_tvl_ratio", ">="),
+    "max_volume_tvl_ratio": ("volume_tvl_ratio", "<="),
+    "min_price_change_24h": ("price_change_24h", ">="),
+    "max_price_change_24h": ("price_change_24h", "<=")
+}
+
+class CategoryCodes:
+    """Interns category labels (networks, DEXes, symbols) as integer codes"""
+    
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+    
+    def encode(self, labels) -> np.ndarray:
+        """Codes for the labels, assigning new codes to unseen labels"""
+        codes = self.codes
+        return np.fromiter((codes.setdefault(label, len(codes)) for label in labels), dtype=np.int32)
+    
+    def lookup(self, labels) -> np.ndarray:
+        """Codes of the known labels among the given ones"""
+        return np.array([self.codes[label] for label in labels if label in self.codes], dtype=np.int32)
+
+class PoolColumns:
+    """Columnar pool table: NumPy arrays for metrics and category codes for labels"""
+    
+    NUMERIC_FIELDS = ["tvl", "volume_24h", "fees_24h", "apy", "price_change_24h", "liquidity_usd"]
+    CATEGORY_FIELDS = ["network", "dex", "token0_symbol", "token1_symbol"]
+    
+    def __init__(self, pools: List[LiquidityPool], values: Dict[str, np.ndarray]):
+        self.pools = pools
+        self.values = values
+    
+    @classmethod
+    def build(cls, pools: List[LiquidityPool], categories: CategoryCodes) -> "PoolColumns":
+        """Build the table for a pool list"""
+        count = len(pools)
+        values = {
+            name: np.fromiter((getattr(p, name) for p in pools), dtype=np.float64, count=count)
+            for name in cls.NUMERIC_FIELDS
+        }
+        values["network"] = categories.encode(p.network for p in pools)
+        values["dex"] = categories.encode(p.dex.lower() for p in pools)
+        values["token0_symbol"] = categories.encode(p.token0_symbol.upper() for p in pools)
+        values["token1_symbol"] = categories.encode(p.token1_symbol.upper() for p in pools)
+        
+        tvl = values["tvl"]
+        values["volume_tvl_ratio"] = np.divide(
+            values["volume_24h"], tvl, out=np.zeros(count), where=tvl > 0
+        )
+        
+        return cls(pools, values)
+    
+    @classmethod
+    def concatenate(cls, tables: List["PoolColumns"]) -> "PoolColumns":
+        """Stack several tables (for example one per network) into one"""
+        pools = [pool for table in tables for pool in table.pools]
+        if not tables:
+            return cls(pools, {})
+        values = {name: np.concatenate([t.values[name] for t in tables]) for name in tables[0].values}
+        return cls(pools, values)
+    
+    def __len__(self) -> int:
+        return len(self.pools)
+
+class PoolHistory:
+    """Fixed-capacity ring buffers of per-pool metrics, sized from a memory budget
+    
+    Every tracked pool owns one row of samples_per_pool slots; each refresh writes
+    one sample per pool. When more pools are seen than fit in the budget, the rows
+    of the pools that have gone longest without an update are reused.
+    """
+    
+    METRICS = ["tvl", "volume_24h", "fees_24h", "apy", "price_change_24h"]
+    
+    def __init__(self, memory_budget_mb: float = 64, samples_per_pool: int = 288):
+        bytes_per_pool = samples_per_pool * (len(self.METRICS) * 4 + 8)
+        self.samples_per_pool = samples_per_pool
+        self.max_pools = max(int(memory_budget_mb * 1024 * 1024) // bytes_per_pool, 1)
+        self.values = np.zeros((self.max_pools, samples_per_pool, len(self.METRICS)), dtype=np.float32)
+        self.timestamps = np.zeros((self.max_pools, samples_per_pool))
+        self.heads = np.zeros(self.max_pools, dtype=np.int64)
+        self.counts = np.zeros(self.max_pools, dtype=np.int64)
+        self.last_seen = np.zeros(self.max_pools)
+        self.rows: Dict[Tuple[str, str], int] = {}
+        self.row_keys: List[Optional[Tuple[str, str]]] = [None] * self.max_pools
+    
+    def assign_rows(self, keys: List[Tuple[str, str]], timestamp: float) -> np.ndarray:
+        """Rows for the given pool keys, allocating or recycling rows for new pools (-1 if none left)"""
+        rows = np.array([self.rows.get(key, -1) for key in keys], dtype=np.int64)
+        self.last_seen[rows[rows >= 0]] = timestamp
+        
+        new = np.flatnonzero(rows < 0)
+        if len(new) == 0:
+            return rows
+        
+        used = len(self.rows)
+        free = np.arange(used, min(used + len(new), self.max_pools))
+        recycled = np.empty(0, dtype=np.int64)
+        shortfall = min(len(new) - len(free), int((self.last_seen[:used] < timestamp).sum()))
+        if shortfall > 0:
+            recycled = np.argpartition(self.last_seen[:used], shortfall - 1)[:shortfall]
+            for row in recycled:
+                del self.rows[self.row_keys[row]]
+        
+        available = np.concatenate([free, recycled])
+        for i, row in zip(new, available):
+            self.rows[keys[i]] = row
+            self.row_keys[row] = keys[i]
+        assigned = new[:len(available)]
+        rows[assigned] = available
+        self.heads[available] = 0
+        self.counts[available] = 0
+        self.last_seen[available] = timestamp
+        
+        return rows
+    
+    def append(self, network: str, pool_keys: List[str], columns: "PoolColumns", timestamp: float):
+        """Record one sample of every pool in a refreshed snapshot"""
+        # Pools without a pair address are keyed by content and can't be tracked over time
+        positions = [i for i, key in enumerate(pool_keys) if not key.startswith("#")]
+        keys = [(network, pool_keys[i]) for i in positions]
+        rows = self.assign_rows(keys, timestamp)
+        
+        kept = rows >= 0
+        rows = rows[kept]
+        positions = np.array(positions, dtype=np.int64)[kept]
+        metrics = np.column_stack([columns.values[name][positions] for name in self.METRICS])
+        
+        heads = self.heads[rows]
+        self.values[rows, heads] = metrics
+        self.timestamps[rows, heads] = timestamp
+        self.heads[rows] = (heads + 1) % self.samples_per_pool
+        self.counts[rows] = np.minimum(self.counts[rows] + 1, self.samples_per_pool)
+    
+    def trend(self, network: str, pair_address: str) -> Optional[Dict[str, Any]]:
+        """Trend statistics of a pool over the retained window"""
+        row = self.rows.get((network, normalize_address(pair_address)))
+        if row is None or not self.counts[row]:
+            return None
+        
+        count = int(self.counts[row])
+        order = (self.heads[row] - count + np.arange(count)) % self.samples_per_pool
+        timestamps = self.timestamps[row, order]
+        tvl, volume, fees, apy, price_change = self.values[row, order].astype(np.float64).T
+        
+        return {
+            "samples": count,
+            "window_start": float(timestamps[0]),
+            "window_end": float(timestamps[-1]),
+            "tvl_first": float(tvl[0]),
+            "tvl_last": float(tvl[-1]),
+            "tvl_delta": float(tvl[-1] - tvl[0]),
+            "tvl_delta_pct": float((tvl[-1] - tvl[0]) / tvl[0] * 100) if tvl[0] else 0.0,
+            "tvl_min": float(tvl.min()),
+            "tvl_max": float(tvl.max()),
+            "volume_24h_mean": float(volume.mean()),
+            "fees_24h_mean": float(fees.mean()),
+            "apy_mean": float(apy.mean()),
+            "apy_std": float(apy.std()),
+            "apy_min": float(apy.min()),
+            "apy_max": float(apy.max()),
+            "price_change_24h_mean": float(price_change.mean())
+        }
+
+@dataclass
+class PoolChangeSet:
+    """Data class for the pools (by pair key) added, removed and changed by a refresh"""
+    added: Set[str] = field(default_factory=set)
+    removed: Set[str] = field(default_factory=set)
+    changed: Set[str] = field(default_factory=set)
+    
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+@dataclass
+class PoolSnapshot:
+    """Data class for the full parsed pool universe of a network"""
+    network: str
+    fetched_at: float
+    pools: List[LiquidityPool]
+    index: PoolIndex
+    orderings: Dict[str, List[LiquidityPool]]
+    columns: PoolColumns
+    pool_keys: List[str] = field(default_factory=list)  # normalized pair address of each pool
+    changes: PoolChangeSet = field(default_factory=PoolChangeSet)
+    version: int = 0  # provider-wide and increasing; only advances when a refresh actually changes the pools
+
+@dataclass
+class Subscription:
+    """Data class for a client subscription to pushed updates"""
+    subscription_id: str
+    resources: List[str]
+    min_change_pct: float
+    notify: Callable[[Dict], Awaitable[None]]
+    last_values: Dict[str, float] = field(default_factory=dict)
+
+class SubscriptionManager:
+    """Runs one shared poller per watched resource and pushes changes to subscribers"""
+    
+    def __init__(self, fetch: Callable[[str], Awaitable[Optional[Dict]]], value_key: str,
+                 notification_method: str, poll_interval: float = 15):
+        self.fetch = fetch
+        self.value_key = value_key
+        self.notification_method = notification_method
+        self.poll_interval = poll_interval
+        self.subscriptions: Dict[str, Subscription] = {}
+        self.watchers: Dict[str, Set[str]] = {}
+        self.pollers: Dict[str, asyncio.Task] = {}
+    
+    def subscribe(self, resources: List[str], min_change_pct: float,
+                  notify: Callable[[Dict], Awaitable[None]]) -> Subscription:
+        """Register a subscription, starting pollers only for resources nobody watches yet"""
+        subscription = Subscription(uuid.uuid4().hex, resources, min_change_pct, notify)
+        self.subscriptions[subscription.subscription_id] = subscription
+        
+        for resource in resources:
+            self.watchers.setdefault(resource, set()).add(subscription.subscription_id)
+            if resource not in self.pollers:
+                self.pollers[resource] = asyncio.create_task(self._poll(resource))
+        
+        return subscription
+    
+    def unsubscribe(self, subscription_id: str) -> bool:
+        """Remove a subscription, stopping pollers that have no watchers left"""
+        subscription = self.subscriptions.pop(subscription_id, None)
+        if not subscription:
+            return False
+        
+        for resource in subscription.resources:
+            watchers = self.watchers.get(resource, set())
+            watchers.discard(subscription_id)
+            if not watchers:
+                self.watchers.pop(resource, None)
+                poller = self.pollers.pop(resource, None)
+                if poller:
+                    poller.cancel()
+        
+        return True
+    
+    def unsubscribe_client(self, notify: Callable[[Dict], Awaitable[None]]) -> int:
+        """Remove every subscription owned by a disconnected client"""
+        owned = [s.subscription_id for s in self.subscriptions.values() if s.notify == notify]
+        for subscription_id in owned:
+            self.unsubscribe(subscription_id)
+        return len(owned)
+    
+    async def close(self):
+        """Cancel all pollers and drop all subscriptions"""
+        for poller in self.pollers.values():
+            poller.cancel()
+        await asyncio.gather(*self.pollers.values(), return_exceptions=True)
+        self.pollers.clear()
+        self.watchers.clear()
+        self.subscriptions.clear()
+    
+    async def _poll(self, resource: str):
+        """Fetch a resource periodically on behalf of all its subscribers"""
+        # Pollers start from the context of the subscribe request and outlive it,
+        # so its deadline must not apply to their fetches
+        request_deadline.set(None)
+        while True:
+            try:
+                payload = await self.fetch(resource)
+                if payload is not None:
+                    await self._publish(resource, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Error polling {resource}: {e}")
+            
+            await asyncio.sleep(self.poll_interval)
+    
+    async def _publish(self, resource: str, payload: Dict):
+        """Notify subscribers whose last seen value moved past their threshold"""
+        value = float(payload.get(self.value_key, 0))
+        sends = []
+        
+        for subscription_id in list(self.watchers.get(resource, ())):
+            subscription = self.subscriptions.get(subscription_id)
+            if not subscription:
+                continue
+            
+            last_value = subscription.last_values.get(resource)
+            if last_value is not None:
+                if last_value == 0:
+                    change_pct = 0 if value == 0 else float("inf")
+                else:
+                    change_pct = (value - last_value) / abs(last_value) * 100
+                if abs(change_pct) < subscription.min_change_pct or change_pct == 0:
+                    continue
+            else:
+                change_pct = 0
+            
+            subscription.last_values[resource] = value
+            sends.append(subscription.notify({
+                "jsonrpc": "2.0",
+                "method": self.notification_method,
+                "params": {
+                    "subscription_id": subscription_id,
+                    "resource": resource,
+                    "change_pct": change_pct,
+                    "data": payload
+                }
+            }))
+        
+        if sends:
+            results = await asyncio.gather(*sends, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.warning(f"Error notifying subscriber of {resource}: {result}")
+
+# Supported networks and their chain IDs
+SUPPORTED_NETWORKS = [
+    ("ethereum", 1),
+    ("bsc", 56),
+    ("polygon", 137),
+    ("arbitrum", 42161),
+    ("optimism", 10),
+    ("base", 8453),
+    ("solana", 0),
+    ("avalanche", 43114),
+    ("fantom", 250),
+    ("aptos", 0),
+    ("sui", 0)
+]
+
+class PrefetchScheduler:
+    """Refreshes the most requested networks shortly before their cached snapshots expire
+    
+    Requests are counted per (network, resource) with exponential decay, so scores
+    follow recent demand. Every interval the top_k networks by score whose snapshots
+    are about to expire are refreshed in the background, as long as the upstream
+    budget (a token bucket of refreshes per minute shared with on-demand misses)
+    allows, and the cache hit rate of those networks is logged. Networks whose
+    score decays below min_score are no longer refreshed and their snapshots are
+    dropped once expired.
+    """
+    
+    def __init__(self, provider: "LiquidityDataProvider", top_k: int = 3, refreshes_per_minute: float = 6,
+                 half_life: float = 600, lead_time: float = 60, interval: float = 15, min_score: float = 0.5):
+        self.provider = provider
+        self.top_k = top_k
+        self.refreshes_per_minute = refreshes_per_minute
+        self.half_life = half_life
+        self.lead_time = lead_time
+        self.interval = interval
+        self.min_score = min_score
+        self.scores: Dict[Tuple[str, str], Tuple[float, float]] = {}  # (network, resource) -> (score, updated at)
+        self.tokens = float(refreshes_per_minute)
+        self.tokens_at = time.time()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.task: Optional[asyncio.Task] = None
+    
+    def decayed(self, score: float, updated_at: float, now: float) -> float:
+        """Score after exponential decay from updated_at to now"""
+        return score * 0.5 ** ((now - updated_at) / self.half_life)
+    
+    def record(self, network: str, resource: str, hit: bool):
+        """Count one request for a network resource"""
+        now = time.time()
+        score, updated_at = self.scores.get((network, resource), (0.0, now))
+        self.scores[(network, resource)] = (self.decayed(score, updated_at, now) + 1, now)
+        
+        counter = self.hits if hit else self.misses
+        counter[network] = counter.get(network, 0) + 1
+    
+    def network_scores(self, now: float) -> Dict[str, float]:
+        """Decayed demand per network, forgetting resources nobody asks for anymore"""
+        totals: Dict[str, float] = {}
+        for key, (score, updated_at) in list(self.scores.items()):
+            score = self.decayed(score, updated_at, now)
+            if score < 0.01:
+                del self.scores[key]
+                continue
+            totals[key[0]] = totals.get(key[0], 0.0) + score
+        
+        # Hit counts are kept only for networks that still have demand
+        for counter in (self.hits, self.misses):
+            for network in [n for n in counter if n not in totals]:
+                del counter[network]
+        return totals
+    
+    def spend(self, now: Optional[float] = None) -> bool:
+        """Take one upstream refresh from the budget; False when it is exhausted"""
+        now = now or time.time()
+        self.tokens = min(self.tokens + (now - self.tokens_at) * self.refreshes_per_minute / 60,
+                          float(self.refreshes_per_minute))
+        self.tokens_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+    
+    def hit_rate(self, network: str) -> float:
+        """Fraction of requests for a network served from a fresh snapshot"""
+        total = self.hits.get(network, 0) + self.misses.get(network, 0)
+        return self.hits.get(network, 0) / total if total else 0.0
+    
+    def start(self):
+        """Start the background prefetch loop"""
+        if not self.task:
+            self.task = asyncio.ensure_future(self.run())
+    
+    async def close(self):
+        """Stop the background prefetch loop"""
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+    
+    async def run(self):
+        """Prefetch loop"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Error in prefetch scheduler: {e}")
+    
+    def tick(self):
+        """Refresh hot networks that are about to expire and drop expired cold ones"""
+        now = time.time()
+        provider = self.provider
+        scores = self.network_scores(now)
+        hot = sorted((n for n, score in scores.items() if score >= self.min_score),
+                     key=scores.get, reverse=True)[:self.top_k]
+        if hot:
+            logger.info("Cache hit rates: " + ", ".join(f"{n} {self.hit_rate(n) * 100:.0f}%" for n in hot))
+        
+        for network in hot:
+            snapshot = provider.snapshots.get(network)
+            if network in provider.refreshes or (
+                    snapshot and now - snapshot.fetched_at < provider.cache_timeout - self.lead_time):
+                continue
+            if not self.spend(now):
+                logger.info(f"Prefetch budget exhausted, skipping {network}")
+                break
+            logger.info(f"Prefetching {network} (score {scores[network]:.1f})")
+            provider.start_refresh(network, background=True)
+        
+        for network, snapshot in list(provider.snapshots.items()):
+            if (scores.get(network, 0.0) < self.min_score and network not in provider.refreshes
+                    and now - snapshot.fetched_at >= provider.cache_timeout):
+                provider.evict(network)
+
 class LiquidityDataProvider:
     """Provider for liquidity pool data from multiple sources"""
     
     def __init__(self):
         self.session: Optional[aiohttp.ClientSession] = None
-        self.cache = {}
+        self.session_users = 0
+        self.snapshots: Dict[str, PoolSnapshot] = {}
+        self.categories = CategoryCodes()
+        self.pool_table: Optional[Tuple[tuple, PoolColumns]] = None  # (snapshot versions, PoolColumns) of the last query
+        self.history = PoolHistory(float(os.getenv("POOL_HISTORY_MB", 64)))
+        self.refreshes: Dict[str, asyncio.Future] = {}
+        self.refresh_waiters: Dict[str, int] = {}
+        # Versions are never reused, even after a network is evicted and rebuilt,
+        # so caches keyed by version can't serve output of an older snapshot
+        self.snapshot_versions = itertools.count(1)
+        # (network, source) -> record key -> (record hash, parsed pool) from the last refresh
+        self.parsed_records: Dict[Tuple[str, str], Dict[str, Tuple[int, LiquidityPool]]] = {}
+        # network -> merged pool per normalized pair address, as of the last refresh
+        self.merged_pools: Dict[str, Dict[str, LiquidityPool]] = {}
         self.cache_timeout = 300  # 5 minutes
+        self.request_timeout = 30
+        self.source_timeout = 10  # per-source deadline before falling back to partial results
+        self.network_fetches = asyncio.Semaphore(6)
+        # Which source wins when several report the same pair; field_precedence
+        # can override the order for individual fields
+        self.source_precedence = ["dexscreener", "coingecko"]
+        self.field_precedence: Dict[str, List[str]] = {}
+        self.prefetch = PrefetchScheduler(
+            self,
+            top_k=int(os.getenv("PREFETCH_TOP_K", 3)),
+            refreshes_per_minute=float(os.getenv("PREFETCH_REFRESHES_PER_MINUTE", 6))
+        )
         
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
+        # The session is shared by concurrent tool calls and pollers, so it is
+        # only closed when the last user leaves
+        if not self.session or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        self.session_users += 1
         return self
         
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
+        self.session_users -= 1
+        if self.session and self.session_users == 0:
             await self.session.close()
+            self.session = None
     
     async def get_dexscreener_data(self, network: str = "ethereum") -> List[Dict]:
         """Get liquidity pool data from DexScreener API"""
@@ -67,7 +681,7 @@ class LiquidityDataProvider:
             
         try:
             url = f"https://api.dexscreener.com/latest/dex/tokens/{network}"
-            async with self.session.get(url, timeout=30) as response:
+            async with self.session.get(url, timeout=upstream_timeout(self.request_timeout)) as response:
                 if response.status == 200:
                     data = await response.json()
                     return data.get('pairs', [])
@@ -102,7 +716,7 @@ class LiquidityDataProvider:
             gecko_id = network_map.get(network, network)
             url = f"https://api.coingecko.com/api/v3/dex/tokens/{gecko_id}"
             
-            async with self.session.get(url, timeout=30) as response:
+            async with self.session.get(url, timeout=upstream_timeout(self.request_timeout)) as response:
                 if response.status == 200:
                     data = await response.json()
                     return data.get('pairs', [])
@@ -113,119 +727,424 @@ class LiquidityDataProvider:
             logger.error(f"Error fetching CoinGecko data: {e}")
             return []
     
-    def parse_pool_data(self, raw_data: List[Dict], network: str) -> List[LiquidityPool]:
+    def parse_pool_item(self, item: Dict, network: str, source: str = "dexscreener") -> LiquidityPool:
+        """Parse one raw API record into a LiquidityPool object"""
+        # Extract basic info
+        token0 = item.get('baseToken', {}).get('address', '')
+        token1 = item.get('quoteToken', {}).get('address', '')
+        token0_symbol = item.get('baseToken', {}).get('symbol', '')
+        token1_symbol = item.get('quoteToken', {}).get('symbol', '')
+        
+        # Extract liquidity and volume data
+        liquidity_usd = float(item.get('liquidity', {}).get('usd', 0))
+        volume_24h = float(item.get('volume', {}).get('h24', 0))
+        fees_24h = float(item.get('fees', {}).get('h24', 0))
+        
+        apy = self.estimate_apy(fees_24h, liquidity_usd)
+        
+        # Extract other metrics
+        tvl = liquidity_usd
+        price_change_24h = float(item.get('priceChange', {}).get('h24', 0))
+        pool_address = item.get('pairAddress', '')
+        pair_address = item.get('pairAddress', '')
+        
+        # Get DEX name
+        dex = item.get('dexId', 'Unknown')
+        
+        return LiquidityPool(
+            network=network,
+            dex=dex,
+            token0=token0,
+            token1=token1,
+            token0_symbol=token0_symbol,
+            token1_symbol=token1_symbol,
+            liquidity_usd=liquidity_usd,
+            volume_24h=volume_24h,
+            fees_24h=fees_24h,
+            apy=apy,
+            tvl=tvl,
+            price_change_24h=price_change_24h,
+            pool_address=pool_address,
+            pair_address=pair_address,
+            sources=[source]
+        )
+    
+    def parse_pool_data(self, raw_data: List[Dict], network: str, source: str = "dexscreener") -> List[LiquidityPool]:
         """Parse raw API data into LiquidityPool objects"""
         pools = []
         
         for item in raw_data:
             try:
-                # Extract basic info
-                token0 = item.get('baseToken', {}).get('address', '')
-                token1 = item.get('quoteToken', {}).get('address', '')
-                token0_symbol = item.get('baseToken', {}).get('symbol', '')
-                token1_symbol = item.get('quoteToken', {}).get('symbol', '')
-                
-                # Extract liquidity and volume data
-                liquidity_usd = float(item.get('liquidity', {}).get('usd', 0))
-                volume_24h = float(item.get('volume', {}).get('h24', 0))
-                fees_24h = float(item.get('fees', {}).get('h24', 0))
-                
-                # Calculate APY (simplified)
-                apy = 0
-                if liquidity_usd > 0 and fees_24h > 0:
-                    daily_fee_rate = fees_24h / liquidity_usd
-                    apy = daily_fee_rate * 365 * 100
-                
-                # Extract other metrics
-                tvl = liquidity_usd
-                price_change_24h = float(item.get('priceChange', {}).get('h24', 0))
-                pool_address = item.get('pairAddress', '')
-                pair_address = item.get('pairAddress', '')
-                
-                # Get DEX name
-                dex = item.get('dexId', 'Unknown')
-                
-                pool = LiquidityPool(
-                    network=network,
-                    dex=dex,
-                    token0=token0,
-                    token1=token1,
-                    token0_symbol=token0_symbol,
-                    token1_symbol=token1_symbol,
-                    liquidity_usd=liquidity_usd,
-                    volume_24h=volume_24h,
-                    fees_24h=fees_24h,
-                    apy=apy,
-                    tvl=tvl,
-                    price_change_24h=price_change_24h,
-                    pool_address=pool_address,
-                    pair_address=pair_address
-                )
-                
-                pools.append(pool)
-                
+                pools.append(self.parse_pool_item(item, network, source))
             except Exception as e:
                 logger.warning(f"Error parsing pool data: {e}")
                 continue
         
         return pools
     
-    async def get_network_pools(self, network: str, sort_by: str = "tvl", limit: int = 50) -> List[LiquidityPool]:
+    def parse_pool_data_incremental(self, raw_data: List[Dict], network: str,
+                                    source: str) -> Tuple[Dict[str, LiquidityPool], Set[str]]:
+        """Parse raw API data, reparsing only records that changed since the last refresh
+        
+        Each record is hashed; unchanged records reuse their previous pool object and
+        changed ones update the previous object in place. Returns the pools keyed by
+        normalized pair address and the keys that changed, including keys this source
+        started or stopped reporting, since those change the merged pool.
+        """
+        previous = self.parsed_records.get((network, source), {})
+        current: Dict[str, Tuple[int, LiquidityPool]] = {}
+        changed = set()
+        pools = {}
+        
+        for item in raw_data:
+            try:
+                digest = pool_record_digest(item)
+                # Records without a pair address are keyed by content, so any change
+                # to them shows up as a removal plus an addition
+                key = normalize_address(item.get('pairAddress') or '') or f"#{digest}"
+                if key in current:
+                    # Keep the first report of a pair, as the full parse does
+                    continue
+                entry = previous.get(key)
+                parsed = None if entry and entry[0] == digest else self.parse_pool_item(item, network, source)
+            except Exception as e:
+                logger.warning(f"Error parsing pool data: {e}")
+                continue
+            
+            if parsed is None:
+                pool = entry[1]
+            elif entry:
+                pool = entry[1]
+                for name in POOL_FIELD_NAMES:
+                    value = getattr(parsed, name)
+                    if getattr(pool, name) != value:
+                        setattr(pool, name, value)
+                changed.add(key)
+            else:
+                pool = parsed
+            
+            current[key] = (digest, pool)
+            pools[key] = pool
+        
+        changed |= current.keys() ^ previous.keys()
+        self.parsed_records[(network, source)] = current
+        
+        return pools, changed
+    
+    def estimate_apy(self, fees_24h: float, liquidity_usd: float) -> float:
+        """Calculate APY (simplified) from daily fees"""
+        if liquidity_usd > 0 and fees_24h > 0:
+            daily_fee_rate = fees_24h / liquidity_usd
+            return daily_fee_rate * 365 * 100
+        return 0
+    
+    def merge_sources(self, pools_by_source: Dict[str, Dict[str, LiquidityPool]]) -> List[str]:
+        """Sources with pools, in precedence order"""
+        sources = self.source_precedence + [s for s in pools_by_source if s not in self.source_precedence]
+        return [source for source in sources if pools_by_source.get(source)]
+    
+    def merge_reports(self, group: Dict[str, LiquidityPool], sources: List[str]) -> LiquidityPool:
+        """Merge the reports of one pair by several sources (in precedence order) into one pool"""
+        # Take each field from the first source (by precedence) that reports it
+        first = next(iter(group.values()))
+        values = {}
+        for field_name in MERGED_POOL_FIELDS:
+            for source in self.field_precedence.get(field_name, sources):
+                pool = group.get(source)
+                if pool and getattr(pool, field_name) not in ("", 0, "Unknown"):
+                    values[field_name] = getattr(pool, field_name)
+                    break
+        
+        pool = replace(first, **values, sources=list(group))
+        pool.apy = self.estimate_apy(pool.fees_24h, pool.liquidity_usd)
+        return pool
+    
+    def merge_pools(self, pools_by_source: Dict[str, Dict[str, LiquidityPool]]) -> Dict[str, LiquidityPool]:
+        """Merge pools from several sources into one pool per normalized pair address
+        
+        Takes and returns pools keyed by normalized pair address.
+        """
+        sources = self.merge_sources(pools_by_source)
+        if len(sources) <= 1:
+            return pools_by_source[sources[0]] if sources else {}
+        
+        # Hash index over the pair keys, collecting the reports of pairs seen by several sources
+        merged = dict(pools_by_source[sources[0]])
+        groups: Dict[str, Dict[str, LiquidityPool]] = {}
+        for source in sources[1:]:
+            for key, pool in pools_by_source[source].items():
+                existing = merged.get(key)
+                if existing is None:
+                    merged[key] = pool
+                    continue
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = {existing.sources[0]: existing}
+                group.setdefault(source, pool)
+        
+        for key, group in groups.items():
+            merged[key] = self.merge_reports(group, sources)
+        
+        return merged
+    
+    def merge_changed_pools(self, merged: Dict[str, LiquidityPool],
+                            pools_by_source: Dict[str, Dict[str, LiquidityPool]],
+                            keys: Set[str]) -> PoolChangeSet:
+        """Merge again only the given pair keys of a previous merge, updating it in place
+        
+        Returns the keys added to, removed from and changed in the merge.
+        """
+        sources = self.merge_sources(pools_by_source)
+        changes = PoolChangeSet()
+        for key in keys:
+            group = {source: pools_by_source[source][key] for source in sources if key in pools_by_source[source]}
+            if not group:
+                if merged.pop(key, None) is not None:
+                    changes.removed.add(key)
+                continue
+            
+            (changes.changed if key in merged else changes.added).add(key)
+            merged[key] = next(iter(group.values())) if len(group) == 1 else self.merge_reports(group, sources)
+        
+        return changes
+    
+    async def fetch_source(self, name: str, fetch: Awaitable[List[Dict]]) -> List[Dict]:
+        """Await one source under its deadline, returning no data if it is too slow"""
+        try:
+            return await asyncio.wait_for(fetch, self.source_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{name} did not respond within {self.source_timeout}s, using partial results")
+            return []
+    
+    async def fetch_network_data(self, network: str) -> Dict[str, List[Dict]]:
+        """Fetch raw pool data for a network from all sources concurrently"""
+        async with self.network_fetches:
+            dexscreener_data, gecko_data = await asyncio.gather(
+                self.fetch_source("DexScreener", self.get_dexscreener_data(network)),
+                self.fetch_source("CoinGecko", self.get_gecko_data(network))
+            )
+        
+        return {"dexscreener": dexscreener_data, "coingecko": gecko_data}
+    
+    async def refresh_network(self, network: str) -> PoolSnapshot:
+        """Fetch, parse and deduplicate the full pool universe of a network"""
+        raw_data = await self.fetch_network_data(network)
+        
+        pools_by_source = {}
+        changed = set()
+        for source, data in raw_data.items():
+            pools_by_source[source], source_changed = self.parse_pool_data_incremental(data, network, source)
+            changed |= source_changed
+        
+        previous = self.snapshots.get(network)
+        merged = self.merged_pools.get(network)
+        if previous and merged is not None:
+            # Only pairs some source reported differently are merged again
+            changes = self.merge_changed_pools(merged, pools_by_source, changed)
+        else:
+            merged = self.merged_pools[network] = dict(self.merge_pools(pools_by_source))
+            changes = PoolChangeSet(added=set(merged))
+        
+        if previous and not changes:
+            # Nothing changed: keep every derived structure and only renew the timestamp
+            snapshot = replace(previous, fetched_at=time.time(), changes=changes)
+        else:
+            snapshot = self.build_snapshot(network, list(merged.values()), list(merged), previous, changes)
+        
+        self.snapshots[network] = snapshot
+        self.history.append(network, snapshot.pool_keys, snapshot.columns, snapshot.fetched_at)
+        
+        return snapshot
+    
+    def build_snapshot(self, network: str, pools: List[LiquidityPool], pool_keys: List[str],
+                       previous: Optional[PoolSnapshot], changes: PoolChangeSet) -> PoolSnapshot:
+        """Build a snapshot with its index, orderings and columns
+        
+        The index and columns are rebuilt from every pool, whatever the size of
+        the change set; only the orderings reuse the previous snapshot.
+        """
+        # Sort once per refresh for every supported key; requests then only slice.
+        # Starting from the previous ordering keeps the input nearly sorted when
+        # churn is low, which Timsort handles in close to linear time
+        if previous:
+            members = {id(p) for p in pools}
+            kept = {id(p) for p in previous.pools if id(p) in members}
+            added = [p for p in pools if id(p) not in kept]
+            base = {
+                sort_by: [p for p in ordering if id(p) in members]
+                for sort_by, ordering in previous.orderings.items()
+            }
+        else:
+            added = pools
+            base = {sort_by: [] for sort_by in SORT_FIELDS}
+        
+        orderings = {
+            sort_by: sorted(base[sort_by] + added, key=attrgetter(field), reverse=True)
+            for sort_by, field in SORT_FIELDS.items()
+        }
+        
+        return PoolSnapshot(
+            network, time.time(), pools, PoolIndex(pools), orderings,
+            PoolColumns.build(pools, self.categories),
+            pool_keys=pool_keys,
+            changes=changes,
+            version=next(self.snapshot_versions)
+        )
+    
+    async def get_pool_snapshot(self, network: str, resource: str = "pools") -> PoolSnapshot:
+        """Get the cached pool universe of a network, refreshing it at most once when expired"""
+        snapshot = self.snapshots.get(network)
+        fresh = bool(snapshot and time.time() - snapshot.fetched_at < self.cache_timeout)
+        self.prefetch.record(network, resource, fresh)
+        if fresh:
+            return snapshot
+        
+        refresh = self.refreshes.get(network)
+        if not refresh or refresh.done():
+            # Misses draw on the same upstream budget as prefetches
+            self.prefetch.spend()
+            refresh = self.start_refresh(network)
+        
+        # A shared refresh outlives the deadline of any single request, but is
+        # cancelled once every request waiting on it has given up
+        self.refresh_waiters[network] = self.refresh_waiters.get(network, 0) + 1
+        try:
+            return await asyncio.shield(refresh)
+        finally:
+            if self.leave_refresh(network) == 0 and not refresh.done():
+                logger.info(f"Cancelling abandoned refresh of {network}")
+                # Forgotten right away, so a request arriving while the cancellation
+                # unwinds starts a new refresh instead of joining this one
+                self.forget_refresh(network, refresh)
+                refresh.cancel()
+    
+    def start_refresh(self, network: str, background: bool = False) -> asyncio.Future:
+        """Start a refresh of a network, shared by concurrent callers while in flight
+        
+        Background refreshes count as a waiter of their own, so they are never
+        cancelled when the requests that joined them give up.
+        """
+        refresh = self.refreshes.get(network)
+        if not refresh or refresh.done():
+            refresh = asyncio.ensure_future(self.refresh_detached(network))
+            self.refreshes[network] = refresh
+            refresh.add_done_callback(lambda done: self.forget_refresh(network, done))
+        if background:
+            self.refresh_waiters[network] = self.refresh_waiters.get(network, 0) + 1
+            refresh.add_done_callback(lambda _: self.leave_refresh(network))
+        return refresh
+    
+    def forget_refresh(self, network: str, refresh: asyncio.Future):
+        """Stop sharing a refresh with new callers, unless another one already replaced it"""
+        if self.refreshes.get(network) is refresh:
+            del self.refreshes[network]
+    
+    async def refresh_detached(self, network: str) -> PoolSnapshot:
+        """Refresh a network outside the deadline of the request that started it"""
+        request_deadline.set(None)
+        return await self.refresh_network(network)
+    
+    def leave_refresh(self, network: str) -> int:
+        """Stop waiting on a network refresh, returning how many waiters are left"""
+        waiters = self.refresh_waiters.get(network, 0) - 1
+        if waiters > 0:
+            self.refresh_waiters[network] = waiters
+        else:
+            self.refresh_waiters.pop(network, None)
+        return max(waiters, 0)
+    
+    def evict(self, network: str):
+        """Drop the cached snapshot and parse state of a network"""
+        self.snapshots.pop(network, None)
+        self.merged_pools.pop(network, None)
+        for key in [key for key in self.parsed_records if key[0] == network]:
+            del self.parsed_records[key]
+        logger.info(f"Evicted cold network {network}")
+    
+    async def get_network_pools(self, network: str, sort_by: str = "tvl", limit: int = 50,
+                                offset: int = 0, resource: str = "pools") -> List[LiquidityPool]:
         """Get liquidity pools for a specific network"""
-        cache_key = f"{network}_{sort_by}_{limit}"
-        
-        # Check cache
-        if cache_key in self.cache:
-            cache_time, cached_data = self.cache[cache_key]
-            if time.time() - cache_time < self.cache_timeout:
-                return cached_data
-        
-        # Fetch data from multiple sources
-        dexscreener_data = await self.get_dexscreener_data(network)
-        gecko_data = await self.get_gecko_data(network)
-        
-        # Combine and parse data
-        all_data = dexscreener_data + gecko_data
-        pools = self.parse_pool_data(all_data, network)
-        
-        # Sort pools
-        if sort_by == "tvl":
-            pools.sort(key=lambda x: x.tvl, reverse=True)
-        elif sort_by == "volume_usd":
-            pools.sort(key=lambda x: x.volume_24h, reverse=True)
-        elif sort_by == "apy":
-            pools.sort(key=lambda x: x.apy, reverse=True)
-        elif sort_by == "fees_24h":
-            pools.sort(key=lambda x: x.fees_24h, reverse=True)
-        
-        # Apply limit
-        pools = pools[:limit]
-        
-        # Cache results
-        self.cache[cache_key] = (time.time(), pools)
+        snapshot = await self.get_pool_snapshot(network, resource)
         
-        return pools
+        if sort_by in snapshot.orderings:
+            return snapshot.orderings[sort_by][offset:offset + limit]
+        
+        # Other numeric fields only need the top offset + limit pools, so a heap
+        # selection avoids sorting the whole universe
+        if sort_by in NUMERIC_POOL_FIELDS:
+            top = heapq.nlargest(offset + limit, snapshot.pools, key=attrgetter(sort_by))
+            return top[offset:]
+        
+        return snapshot.pools[offset:offset + limit]
+    
+    async def query_pools(self, filters: Dict, networks: Optional[List[str]] = None,
+                          sort_by: str = "tvl", limit: int = 50) -> Tuple[List[LiquidityPool], int]:
+        """Screen pools across networks with composable vectorized predicates
+        
+        Returns the top matching pools and the total number of matches.
+        """
+        names = networks or [name for name, _ in SUPPORTED_NETWORKS]
+        snapshots = await asyncio.gather(*(self.get_pool_snapshot(name, "query") for name in names))
+        
+        # Reuse the stacked table while none of its snapshots has been refreshed
+        versions = tuple((s.network, s.fetched_at) for s in snapshots)
+        if not self.pool_table or self.pool_table[0] != versions:
+            self.pool_table = (versions, PoolColumns.concatenate([s.columns for s in snapshots]))
+        table = self.pool_table[1]
+        values = table.values
+        
+        mask = np.ones(len(table), dtype=bool)
+        for argument, (column, comparison) in QUERY_RANGE_FILTERS.items():
+            if filters.get(argument) is not None:
+                bound = float(filters[argument])
+                mask &= values[column] >= bound if comparison == ">=" else values[column] <= bound
+        
+        if filters.get("dexes"):
+            mask &= np.isin(values["dex"], self.categories.lookup(d.lower() for d in filters["dexes"]))
+        if filters.get("tokens"):
+            codes = self.categories.lookup(t.upper() for t in filters["tokens"])
+            mask &= np.isin(values["token0_symbol"], codes) | np.isin(values["token1_symbol"], codes)
+        
+        matched = np.flatnonzero(mask)
+        if len(matched) == 0 or limit <= 0:
+            return [], len(matched)
+        
+        # Partial selection of the top rows before sorting only those
+        column = values.get(SORT_FIELDS.get(sort_by, sort_by), values["tvl"])
+        keys = -column[matched]
+        if len(matched) > limit:
+            top = np.argpartition(keys, limit - 1)[:limit]
+            top = top[np.argsort(keys[top], kind="stable")]
+        else:
+            top = np.argsort(keys, kind="stable")
+        
+        return [table.pools[i] for i in matched[top]], len(matched)
+    
+    def get_pool_history(self, pool_address: str, network: str = "ethereum") -> Optional[Dict[str, Any]]:
+        """Get trend statistics of a pool from recorded refreshes, without upstream calls"""
+        trend = self.history.trend(network, pool_address)
+        if not trend:
+            return None
+        
+        # Attach pool details when the network is still in memory
+        snapshot = self.snapshots.get(network)
+        if snapshot:
+            positions = snapshot.index.by_address.get(normalize_address(pool_address), [])
+            pool = next((snapshot.pools[i] for i in positions
+                         if normalize_address(snapshot.pools[i].pair_address) == normalize_address(pool_address)), None)
+            if pool:
+                trend["pool"] = pool
+        
+        return trend
     
     async def get_available_networks(self) -> List[NetworkInfo]:
         """Get list of available networks with basic stats"""
-        networks = [
-            NetworkInfo("ethereum", 1, 0, 0, 0),
-            NetworkInfo("bsc", 56, 0, 0, 0),
-            NetworkInfo("polygon", 137, 0, 0, 0),
-            NetworkInfo("arbitrum", 42161, 0, 0, 0),
-            NetworkInfo("optimism", 10, 0, 0, 0),
-            NetworkInfo("base", 8453, 0, 0, 0),
-            NetworkInfo("solana", 0, 0, 0, 0),
-            NetworkInfo("avalanche", 43114, 0, 0, 0),
-            NetworkInfo("fantom", 250, 0, 0, 0),
-            NetworkInfo("aptos", 0, 0, 0, 0),
-            NetworkInfo("sui", 0, 0, 0, 0)
-        ]
-        
-        # Try to get basic stats for each network
-        for network in networks:
+        networks = [NetworkInfo(name, chain_id, 0, 0, 0) for name, chain_id in SUPPORTED_NETWORKS]
+        
+        # Try to get basic stats for each network, fetching all networks concurrently
+        async def load_stats(network: NetworkInfo):
             try:
-                pools = await self.get_network_pools(network.name, limit=10)
+                pools = await self.get_network_pools(network.name, limit=10, resource="networks")
                 if pools:
                     network.tvl = sum(p.tvl for p in pools)
                     network.pool_count = len(pools)
@@ -233,38 +1152,31 @@ class LiquidityDataProvider:
             except Exception as e:
                 logger.warning(f"Error getting stats for {network.name}: {e}")
         
+        await asyncio.gather(*(load_stats(network) for network in networks))
+        
         return networks
     
     async def search_pools_by_token(self, token_symbol: str, network: str = "ethereum") -> List[LiquidityPool]:
-        """Search for pools containing a specific token"""
-        pools = await self.get_network_pools(network, limit=100)
-        
-        # Filter pools containing the token
-        matching_pools = []
-        token_symbol_upper = token_symbol.upper()
+        """Search for pools containing a specific token (by symbol substring or exact address)"""
+        snapshot = await self.get_pool_snapshot(network, "search")
+        positions = snapshot.index.search(token_symbol)
         
-        for pool in pools:
-            if (token_symbol_upper in pool.token0_symbol.upper() or 
-                token_symbol_upper in pool.token1_symbol.upper()):
-                matching_pools.append(pool)
+        matching_pools = [snapshot.pools[i] for i in positions]
+        matching_pools.sort(key=lambda x: x.tvl, reverse=True)
         
         return matching_pools
     
     async def get_pool_comparison(self, token_symbol: str, network: str = "ethereum") -> Dict:
         """Compare pools across different DEXes for a token"""
-        pools = await self.search_pools_by_token(token_symbol, network)
-        
-        # Group by DEX
-        dex_pools = {}
-        for pool in pools:
-            if pool.dex not in dex_pools:
-                dex_pools[pool.dex] = []
-            dex_pools[pool.dex].append(pool)
+        snapshot = await self.get_pool_snapshot(network, "comparison")
+        positions = snapshot.index.search(token_symbol)
         
-        # Find best pools per DEX
+        # Group matches using the precomputed DEX buckets
         comparison = {}
-        for dex, dex_pools_list in dex_pools.items():
-            if dex_pools_list:
+        for dex, bucket in snapshot.index.by_dex.items():
+            matched = bucket & positions
+            if matched:
+                dex_pools_list = [snapshot.pools[i] for i in matched]
                 best_pool = max(dex_pools_list, key=lambda x: x.tvl)
                 comparison[dex] = {
                     "best_pool": best_pool,
@@ -273,15 +1185,85 @@ class LiquidityDataProvider:
                     "total_volume": sum(p.volume_24h for p in dex_pools_list)
                 }
         
-        return comparison
+        return dict(sorted(comparison.items(), key=lambda item: item[1]["best_pool"].tvl, reverse=True))
+    
+    async def gather_networks(self, fetch: Callable[[str], Awaitable[Any]]) -> Dict[str, Any]:
+        """Run a per-network lookup on every supported network concurrently, skipping networks that fail"""
+        names = [name for name, _ in SUPPORTED_NETWORKS]
+        results = await asyncio.gather(*(fetch(name) for name in names), return_exceptions=True)
+        
+        by_network = {}
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Error searching {name}: {result}")
+                continue
+            by_network[name] = result
+        return by_network
+    
+    async def search_pools_all_networks(self, token_symbol: str,
+                                        sort_by: str = "tvl") -> Tuple[List[LiquidityPool], Dict[str, Dict]]:
+        """Search every supported network for a token, ranking the matches globally
+        
+        Returns the ranked pools and per-network subtotals.
+        """
+        by_network = await self.gather_networks(lambda name: self.search_pools_by_token(token_symbol, name))
+        
+        subtotals = {}
+        matching_pools = []
+        for name, pools in by_network.items():
+            if not pools:
+                continue
+            matching_pools.extend(pools)
+            subtotals[name] = {
+                "total_pools": len(pools),
+                "total_tvl": sum(p.tvl for p in pools),
+                "total_volume": sum(p.volume_24h for p in pools)
+            }
+        
+        matching_pools.sort(key=attrgetter(SORT_FIELDS.get(sort_by, "tvl")), reverse=True)
+        
+        return matching_pools, subtotals
+    
+    async def get_pool_comparison_all_networks(self, token_symbol: str,
+                                               sort_by: str = "tvl") -> Tuple[List[Dict], Dict[str, Dict]]:
+        """Compare a token's pools per DEX on every supported network, ranking the DEXes globally
+        
+        Returns the ranked (network, DEX) entries and per-network subtotals.
+        """
+        by_network = await self.gather_networks(lambda name: self.get_pool_comparison(token_symbol, name))
+        
+        subtotals = {}
+        entries = []
+        for name, comparison in by_network.items():
+            if not comparison:
+                continue
+            entries.extend({"network": name, "dex": dex, **data} for dex, data in comparison.items())
+            subtotals[name] = {
+                "total_dexes": len(comparison),
+                "total_pools": sum(data["total_pools"] for data in comparison.values()),
+                "total_tvl": sum(data["total_tvl"] for data in comparison.values()),
+                "total_volume": sum(data["total_volume"] for data in comparison.values())
+            }
+        
+        field_name = SORT_FIELDS.get(sort_by, "tvl")
+        entries.sort(key=lambda entry: getattr(entry["best_pool"], field_name), reverse=True)
+        
+        return entries, subtotals
 
 class LiquidityMCPServer:
     """MCP Server for liquidity pool analysis"""
     
     def __init__(self):
         self.provider = LiquidityDataProvider()
+        self.subscriptions = SubscriptionManager(
+            self.fetch_network_update, "tvl", "notifications/network_stats", poll_interval=60
+        )
+        # Rendered output keyed by snapshot version, so it is reused until a refresh changes the pools
+        self.network_updates: Dict[str, Tuple[int, Dict]] = {}
+        self.rendered_pools: Dict[tuple, str] = {}
     
-    async def handle_request(self, request: Dict) -> Dict:
+    async def handle_request(self, request: Dict,
+                             notify: Optional[Callable[[Dict], Awaitable[None]]] = None) -> Dict:
         """Handle incoming MCP requests"""
         method = request.get("method")
         params = request.get("params", {})
@@ -291,12 +1273,73 @@ class LiquidityMCPServer:
                 return await self.list_tools()
             elif method == "tools/call":
                 return await self.call_tool(params)
+            elif method == "subscribe":
+                return self.subscribe(params, notify)
+            elif method == "unsubscribe":
+                return self.unsubscribe(params)
             else:
                 return {"error": {"code": -32601, "message": f"Method {method} not found"}}
         except Exception as e:
             logger.error(f"Error handling request: {e}")
             return {"error": {"code": -32603, "message": str(e)}}
     
+    def subscribe(self, params: Dict, notify: Optional[Callable[[Dict], Awaitable[None]]]) -> Dict:
+        """Subscribe the client to pushed network liquidity updates"""
+        if notify is None:
+            return {"error": {"code": -32600, "message": "Subscriptions require a streaming transport"}}
+        
+        networks = params.get("networks")
+        if networks is None:
+            networks = ["ethereum"]
+        if not isinstance(networks, list) or not networks or not all(isinstance(r, str) and r for r in networks):
+            return {"error": {"code": -32602, "message": "networks must be a non-empty list of strings"}}
+        min_change_pct = float(params.get("min_change_pct", 1.0))
+        
+        subscription = self.subscriptions.subscribe(networks, min_change_pct, notify)
+        
+        return {
+            "result": {
+                "subscription_id": subscription.subscription_id,
+                "networks": networks,
+                "min_change_pct": min_change_pct
+            }
+        }
+    
+    def unsubscribe(self, params: Dict) -> Dict:
+        """Cancel a network subscription"""
+        subscription_id = params.get("subscription_id")
+        if not self.subscriptions.unsubscribe(subscription_id):
+            return {"error": {"code": -32602, "message": f"Subscription {subscription_id} not found"}}
+        
+        return {"result": {"unsubscribed": subscription_id}}
+    
+    async def fetch_network_update(self, network: str) -> Optional[Dict]:
+        """Fetch aggregate pool stats of a network for the shared poller"""
+        async with self.provider as provider:
+            snapshot = await provider.get_pool_snapshot(network, "subscription")
+        
+        # Only recompute the stats when the refresh reported changes
+        cached = self.network_updates.get(network)
+        if cached and cached[0] == snapshot.version:
+            return cached[1]
+        
+        pools = snapshot.orderings["tvl"][:10]
+        if not pools:
+            return None
+        
+        update = {
+            "network": network,
+            "tvl": sum(p.tvl for p in pools),
+            "volume_24h": sum(p.volume_24h for p in pools),
+            "pool_count": len(pools),
+            "pools_added": len(snapshot.changes.added),
+            "pools_removed": len(snapshot.changes.removed),
+            "pools_changed": len(snapshot.changes.changed)
+        }
+        self.network_updates[network] = (snapshot.version, update)
+        
+        return update
+    
     async def list_tools(self) -> Dict:
         """List available tools"""
         return {
@@ -315,13 +1358,18 @@ class LiquidityMCPServer:
                                 },
                                 "sort_by": {
                                     "type": "string",
-                                    "description": "Sort by: tvl, volume_usd, apy, fees_24h",
+                                    "description": "Sort by: tvl, volume_usd, apy, fees_24h (or any numeric pool field such as price_change_24h)",
                                     "default": "tvl"
                                 },
                                 "limit": {
                                     "type": "integer",
                                     "description": "Number of pools to return",
                                     "default": 20
+                                },
+                                "offset": {
+                                    "type": "integer",
+                                    "description": "Number of pools to skip, for pagination",
+                                    "default": 0
                                 }
                             }
                         }
@@ -346,8 +1394,14 @@ class LiquidityMCPServer:
                                 },
                                 "network": {
                                     "type": "string",
-                                    "description": "Network name",
+                                    "description": "Network name, or \"all\" to search every supported network",
                                     "default": "ethereum"
+                                },
+                                "sort_by": {
+                                    "type": "string",
+                                    "description": "Ranking field when network is \"all\"",
+                                    "enum": ["tvl", "volume_usd", "apy", "fees_24h"],
+                                    "default": "tvl"
                                 }
                             },
                             "required": ["token_symbol"]
@@ -365,12 +1419,81 @@ class LiquidityMCPServer:
                                 },
                                 "network": {
                                     "type": "string",
-                                    "description": "Network name",
+                                    "description": "Network name, or \"all\" to search every supported network",
                                     "default": "ethereum"
+                                },
+                                "sort_by": {
+                                    "type": "string",
+                                    "description": "Ranking field when network is \"all\"",
+                                    "enum": ["tvl", "volume_usd", "apy", "fees_24h"],
+                                    "default": "tvl"
                                 }
                             },
                             "required": ["token_symbol"]
                         }
+                    },
+                    {
+                        "name": "get_pool_history",
+                        "description": "Get TVL, volume and APY trends of a pool from recorded refreshes",
+                        "inputSchema": {
+                            "type": "object",
+                            "properties": {
+                                "pool_address": {
+                                    "type": "string",
+                                    "description": "Pool (pair) address"
+                                },
+                                "network": {
+                                    "type": "string",
+                                    "description": "Network name",
+                                    "default": "ethereum"
+                                }
+                            },
+                            "required": ["pool_address"]
+                        }
+                    },
+                    {
+                        "name": "query_pools",
+                        "description": "Screen pools across networks with combined filters on TVL, volume, APY, DEX and tokens",
+                        "inputSchema": {
+                            "type": "object",
+                            "properties": {
+                                "networks": {
+                                    "type": "array",
+                                    "items": {"type": "string"},
+                                    "description": "Networks to screen (default: all supported networks)"
+                                },
+                                "min_tvl": {"type": "number", "description": "Minimum TVL in USD"},
+                                "max_tvl": {"type": "number", "description": "Maximum TVL in USD"},
+                                "min_volume_24h": {"type": "number", "description": "Minimum 24h volume in USD"},
+                                "min_fees_24h": {"type": "number", "description": "Minimum 24h fees in USD"},
+                                "min_apy": {"type": "number", "description": "Minimum APY in percent"},
+                                "max_apy": {"type": "number", "description": "Maximum APY in percent"},
+                                "min_volume_tvl_ratio": {"type": "number", "description": "Minimum 24h volume / TVL ratio"},
+                                "max_volume_tvl_ratio": {"type": "number", "description": "Maximum 24h volume / TVL ratio"},
+                                "min_price_change_24h": {"type": "number", "description": "Minimum 24h price change in percent"},
+                                "max_price_change_24h": {"type": "number", "description": "Maximum 24h price change in percent"},
+                                "dexes": {
+                                    "type": "array",
+                                    "items": {"type": "string"},
+                                    "description": "Only pools on these DEXes"
+                                },
+                                "tokens": {
+                                    "type": "array",
+                                    "items": {"type": "string"},
+                                    "description": "Only pools containing one of these token symbols"
+                                },
+                                "sort_by": {
+                                    "type": "string",
+                                    "description": "Sort by: tvl, volume_usd, apy, fees_24h, volume_tvl_ratio",
+                                    "default": "tvl"
+                                },
+                                "limit": {
+                                    "type": "integer",
+                                    "description": "Number of pools to return",
+                                    "default": 20
+                                }
+                            }
+                        }
                     }
                 ]
             }
@@ -386,15 +1509,24 @@ class LiquidityMCPServer:
                 network = arguments.get("network", "ethereum")
                 sort_by = arguments.get("sort_by", "tvl")
                 limit = arguments.get("limit", 20)
+                offset = arguments.get("offset", 0)
                 
-                pools = await provider.get_network_pools(network, sort_by, limit)
+                pools = await provider.get_network_pools(network, sort_by, limit, offset)
+                
+                render_key = (network, provider.snapshots[network].version, sort_by, limit, offset)
+                text = self.rendered_pools.get(render_key)
+                if text is None:
+                    if len(self.rendered_pools) >= 512:
+                        self.rendered_pools.clear()
+                    text = self.format_pools_response(pools, network, sort_by, offset)
+                    self.rendered_pools[render_key] = text
                 
                 return {
                     "result": {
                         "content": [
                             {
                                 "type": "text",
-                                "text": self.format_pools_response(pools, network, sort_by)
+                                "text": text
                             }
                         ]
                     }
@@ -418,6 +1550,21 @@ class LiquidityMCPServer:
                 token_symbol = arguments.get("token_symbol")
                 network = arguments.get("network", "ethereum")
                 
+                if network == "all":
+                    sort_by = arguments.get("sort_by", "tvl")
+                    pools, subtotals = await provider.search_pools_all_networks(token_symbol, sort_by)
+                    
+                    return {
+                        "result": {
+                            "content": [
+                                {
+                                    "type": "text",
+                                    "text": self.format_cross_network_search_response(pools, subtotals, token_symbol, sort_by)
+                                }
+                            ]
+                        }
+                    }
+                
                 pools = await provider.search_pools_by_token(token_symbol, network)
                 
                 return {
@@ -435,6 +1582,21 @@ class LiquidityMCPServer:
                 token_symbol = arguments.get("token_symbol")
                 network = arguments.get("network", "ethereum")
                 
+                if network == "all":
+                    sort_by = arguments.get("sort_by", "tvl")
+                    entries, subtotals = await provider.get_pool_comparison_all_networks(token_symbol, sort_by)
+                    
+                    return {
+                        "result": {
+                            "content": [
+                                {
+                                    "type": "text",
+                                    "text": self.format_cross_network_comparison_response(entries, subtotals, token_symbol, sort_by)
+                                }
+                            ]
+                        }
+                    }
+                
                 comparison = await provider.get_pool_comparison(token_symbol, network)
                 
                 return {
@@ -448,17 +1610,52 @@ class LiquidityMCPServer:
                     }
                 }
             
+            elif tool_name == "get_pool_history":
+                pool_address = arguments.get("pool_address")
+                network = arguments.get("network", "ethereum")
+                
+                trend = provider.get_pool_history(pool_address, network)
+                
+                return {
+                    "result": {
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": self.format_pool_history_response(trend, pool_address, network)
+                            }
+                        ]
+                    }
+                }
+            
+            elif tool_name == "query_pools":
+                sort_by = arguments.get("sort_by", "tvl")
+                
+                pools, total = await provider.query_pools(
+                    arguments, arguments.get("networks"), sort_by, arguments.get("limit", 20)
+                )
+                
+                return {
+                    "result": {
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": self.format_query_response(pools, total, sort_by)
+                            }
+                        ]
+                    }
+                }
+            
             else:
                 return {"error": {"code": -32601, "message": f"Tool {tool_name} not found"}}
     
-    def format_pools_response(self, pools: List[LiquidityPool], network: str, sort_by: str) -> str:
+    def format_pools_response(self, pools: List[LiquidityPool], network: str, sort_by: str, offset: int = 0) -> str:
         """Format pools response as text"""
         if not pools:
             return f"Nenhum pool de liquidez encontrado para {network}."
         
         result = f"🏊 **Pools de Liquidez - {network.upper()}** (Ordenado por {sort_by})\n\n"
         
-        for i, pool in enumerate(pools[:20], 1):
+        for i, pool in enumerate(pools[:20], offset + 1):
             result += f"**{i}. {pool.token0_symbol}/{pool.token1_symbol}** ({pool.dex})\n"
             result += f"   💰 TVL: ${pool.tvl:,.0f}\n"
             result += f"   📊 Volume 24h: ${pool.volume_24h:,.0f}\n"
@@ -516,30 +1713,365 @@ class LiquidityMCPServer:
             result += f"   💰 TVL Total: ${data['total_tvl']:,.0f}\n\n"
         
         return result
+    
+    def format_network_subtotals(self, subtotals: Dict[str, Dict]) -> str:
+        """Format per-network subtotals of a cross-network search as text"""
+        result = "🌐 **Subtotais por Rede**\n\n"
+        
+        for name, totals in sorted(subtotals.items(), key=lambda item: item[1]["total_tvl"], reverse=True):
+            result += f"**{name.upper()}**: {totals['total_pools']} pools"
+            if "total_dexes" in totals:
+                result += f" em {totals['total_dexes']} DEXes"
+            result += f" · 💰 TVL ${totals['total_tvl']:,.0f} · 📊 Volume 24h ${totals['total_volume']:,.0f}\n"
+        
+        return result
+    
+    def format_cross_network_search_response(self, pools: List[LiquidityPool], subtotals: Dict[str, Dict],
+                                             token_symbol: str, sort_by: str) -> str:
+        """Format cross-network token search response as text"""
+        if not pools:
+            return f"Nenhum pool encontrado para {token_symbol} em nenhuma rede."
+        
+        result = f"🔍 **Pools para {token_symbol} em Todas as Redes** ({len(pools)} encontrados, ordenados por {sort_by})\n\n"
+        
+        for i, pool in enumerate(pools[:20], 1):
+            result += f"**{i}. {pool.token0_symbol}/{pool.token1_symbol}** ({pool.dex} - {pool.network.upper()})\n"
+            result += f"   💰 TVL: ${pool.tvl:,.0f}\n"
+            result += f"   📊 Volume 24h: ${pool.volume_24h:,.0f}\n"
+            result += f"   📈 APY: {pool.apy:.2f}%\n"
+            result += f"   🔗 Pool: {pool.pool_address[:10]}...\n\n"
+        
+        result += self.format_network_subtotals(subtotals)
+        
+        return result
+    
+    def format_cross_network_comparison_response(self, entries: List[Dict], subtotals: Dict[str, Dict],
+                                                 token_symbol: str, sort_by: str) -> str:
+        """Format cross-network DEX comparison response as text"""
+        if not entries:
+            return f"Nenhuma comparação disponível para {token_symbol} em nenhuma rede."
+        
+        result = f"⚖️ **Comparação de DEXes para {token_symbol} em Todas as Redes** (ordenado por {sort_by})\n\n"
+        
+        for entry in entries[:20]:
+            pool = entry["best_pool"]
+            result += f"**{entry['dex'].upper()} - {entry['network'].upper()}**\n"
+            result += f"   🏆 Melhor Pool: {pool.token0_symbol}/{pool.token1_symbol}\n"
+            result += f"   💰 TVL: ${pool.tvl:,.0f}\n"
+            result += f"   📊 Volume 24h: ${pool.volume_24h:,.0f}\n"
+            result += f"   📈 APY: {pool.apy:.2f}%\n"
+            result += f"   🏊 Total Pools: {entry['total_pools']}\n"
+            result += f"   💰 TVL Total: ${entry['total_tvl']:,.0f}\n\n"
+        
+        result += self.format_network_subtotals(subtotals)
+        
+        return result
+    
+    def format_pool_history_response(self, trend: Optional[Dict[str, Any]], pool_address: str, network: str) -> str:
+        """Format pool history response as text"""
+        if not trend:
+            return f"Nenhum histórico registrado para o pool {pool_address} em {network}."
+        
+        pool = trend.get("pool")
+        name = f"{pool.token0_symbol}/{pool.token1_symbol} ({pool.dex})" if pool else pool_address
+        window_hours = (trend["window_end"] - trend["window_start"]) / 3600
+        
+        result = f"📜 **Histórico do Pool {name} em {network.upper()}**\n\n"
+        result += f"🕐 **Amostras**: {trend['samples']} (janela de {window_hours:.1f}h)\n"
+        result += f"💰 **TVL**: ${trend['tvl_first']:,.0f} → ${trend['tvl_last']:,.0f} ({trend['tvl_delta']:+,.0f} / {trend['tvl_delta_pct']:+.2f}%)\n"
+        result += f"   Mínimo ${trend['tvl_min']:,.0f} · Máximo ${trend['tvl_max']:,.0f}\n"
+        result += f"📊 **Volume 24h médio**: ${trend['volume_24h_mean']:,.0f}\n"
+        result += f"💸 **Taxas 24h médias**: ${trend['fees_24h_mean']:,.2f}\n"
+        result += f"📈 **APY**: média {trend['apy_mean']:.2f}% · desvio padrão {trend['apy_std']:.2f}% · faixa {trend['apy_min']:.2f}% a {trend['apy_max']:.2f}%\n"
+        result += f"📉 **Variação 24h média**: {trend['price_change_24h_mean']:+.2f}%\n"
+        
+        return result
+    
+    def format_query_response(self, pools: List[LiquidityPool], total: int, sort_by: str) -> str:
+        """Format pool screening response as text"""
+        if not pools:
+            return "Nenhum pool atende aos filtros informados."
+        
+        result = f"🔎 **Pools Filtrados** ({total} encontrados, ordenados por {sort_by})\n\n"
+        
+        for i, pool in enumerate(pools, 1):
+            result += f"**{i}. {pool.token0_symbol}/{pool.token1_symbol}** ({pool.dex} - {pool.network.upper()})\n"
+            result += f"   💰 TVL: ${pool.tvl:,.0f}\n"
+            result += f"   📊 Volume 24h: ${pool.volume_24h:,.0f}\n"
+            result += f"   📈 APY: {pool.apy:.2f}%\n"
+            result += f"   🔗 Pool: {pool.pool_address[:10]}...\n\n"
+        
+        return result
 
-async def main():
-    """Main function to run the MCP server"""
-    server = LiquidityMCPServer()
+class AdmissionQueue:
+    """Bounds the requests handled at once across all clients
+    
+    Up to max_active requests run concurrently and up to max_queued more wait for a
+    slot; anything beyond that is rejected right away, so overload is answered with
+    fast errors instead of piling up tasks and memory.
+    """
+    
+    def __init__(self, max_active: int = 64, max_queued: int = 256):
+        self.capacity = max_active + max_queued
+        self.slots = asyncio.Semaphore(max_active)
+        self.admitted = 0
+    
+    def try_admit(self) -> bool:
+        """Reserve room for a request, or return False when the queue is full"""
+        if self.admitted >= self.capacity:
+            return False
+        self.admitted += 1
+        return True
+    
+    def release(self):
+        """Give back the room of a finished request"""
+        self.admitted -= 1
+
+class MessageChannel:
+    """Line-delimited JSON channel with a single writer task that coalesces flushes"""
     
-    # Read from stdin, write to stdout
-    while True:
+    def __init__(self, reader: asyncio.StreamReader, write: Callable[[bytes], None],
+                 drain: Callable[[], Awaitable[None]], max_pending: int = 1000,
+                 max_in_flight: int = 64, admission: Optional[AdmissionQueue] = None):
+        self.reader = reader
+        self.write = write
+        self.drain = drain
+        self.outbox: asyncio.Queue = asyncio.Queue(max_pending)
+        # Bounds the requests a single client can have admitted, so one flooding
+        # client can't take the whole shared admission queue
+        self.max_in_flight = max_in_flight
+        self.admission = admission or AdmissionQueue()
+        # In-flight requests by JSON-RPC id, so cancellation notifications can find them
+        self.requests: Dict[Any, asyncio.Task] = {}
+    
+    async def send(self, message: Dict):
+        """Queue a message for the writer task"""
+        await self.outbox.put(json_dumps(message) + b"\n")
+    
+    async def notify(self, message: Dict):
+        """Queue a notification without waiting, dropping it if the client isn't reading
+        
+        Notifications are sent from pollers shared by every subscriber, so a full
+        outbox must not hold them up for the other clients.
+        """
         try:
-            line = await asyncio.get_event_loop().run_in_executor(None, sys.stdin.readline)
-            if not line:
-                break
+            self.outbox.put_nowait(json_dumps(message) + b"\n")
+        except asyncio.QueueFull:
+            logger.warning(f"Outbox full, dropping {message.get('method')} notification")
+    
+    async def _write_loop(self):
+        """Write every queued message, flushing once per batch instead of once per message"""
+        while True:
+            chunks = [await self.outbox.get()]
+            while not self.outbox.empty():
+                chunks.append(self.outbox.get_nowait())
             
-            request = json.loads(line.strip())
-            response = await server.handle_request(request)
+            try:
+                self.write(b"".join(chunks))
+                await self.drain()
+            except Exception as e:
+                logger.error(f"Error writing response: {e}")
+            finally:
+                for _ in chunks:
+                    self.outbox.task_done()
+    
+    async def _handle(self, server, request: Dict) -> Dict:
+        """Wait for a free slot and handle the request"""
+        async with self.admission.slots:
+            return await server.handle_request(request, self.notify)
+    
+    async def _dispatch(self, server, request: Dict):
+        """Handle one admitted request within its deadline and queue its response"""
+        try:
+            params = request.get("params")
+            meta = params.get("_meta") if isinstance(params, dict) else None
+            timeout_ms = meta.get("timeoutMs") if isinstance(meta, dict) else None
+            valid_timeout = (timeout_ms is None or (
+                isinstance(timeout_ms, (int, float)) and not isinstance(timeout_ms, bool) and timeout_ms > 0
+            ))
             
-            # Write response to stdout
-            print(json.dumps(response), flush=True)
+            try:
+                if not valid_timeout:
+                    response = {"error": {"code": -32602, "message": f"Invalid _meta.timeoutMs {timeout_ms!r}: expected a positive number"}}
+                elif timeout_ms is not None:
+                    # The deadline covers the wait for a slot and every upstream call made for the request
+                    timeout = timeout_ms / 1000
+                    request_deadline.set(asyncio.get_running_loop().time() + timeout)
+                    response = await asyncio.wait_for(self._handle(server, request), timeout)
+                else:
+                    response = await self._handle(server, request)
+            except asyncio.TimeoutError:
+                response = {"error": {"code": -32001, "message": f"Request timed out after {timeout_ms} ms"}}
             
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON: {e}")
-            continue
-        except Exception as e:
-            logger.error(f"Unexpected error: {e}")
-            continue
+            if "id" in request:
+                response = {"jsonrpc": "2.0", "id": request["id"], **response}
+            await self.send(response)
+        except asyncio.CancelledError:
+            # Cancelled requests get no response
+            logger.info(f"Request {request.get('id')} cancelled")
+    
+    def cancel(self, request_id: Any):
+        """Cancel an in-flight request on behalf of the client"""
+        task = self.requests.get(request_id)
+        if task:
+            task.cancel()
+    
+    async def reject(self, request: Dict):
+        """Answer a request that didn't fit in the admission queue"""
+        logger.warning(f"Server overloaded, rejecting {request.get('method')}")
+        if "id" in request:
+            await self.send({
+                "jsonrpc": "2.0",
+                "id": request["id"],
+                "error": {"code": -32000, "message": "Server overloaded, try again later"}
+            })
+    
+    async def serve(self, server):
+        """Read requests until EOF, handling them concurrently"""
+        writer_task = asyncio.create_task(self._write_loop())
+        pending = set()
+        
+        try:
+            while True:
+                try:
+                    line = await self.reader.readline()
+                except (ConnectionError, ValueError) as e:
+                    logger.warning(f"Closing channel: {e}")
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                
+                try:
+                    request = json_loads(line)
+                except ValueError as e:
+                    # JSONDecodeError, or UnicodeDecodeError from the stdlib on invalid UTF-8
+                    logger.error(f"Invalid JSON: {e}")
+                    continue
+                
+                if not isinstance(request, dict):
+                    logger.error(f"Invalid request, expected a JSON object: {line[:100]!r}")
+                    await self.send({
+                        "jsonrpc": "2.0",
+                        "id": None,
+                        "error": {"code": -32600, "message": "Invalid Request: expected a JSON object"}
+                    })
+                    continue
+                
+                if request.get("method") == "notifications/cancelled":
+                    self.cancel((request.get("params") or {}).get("requestId"))
+                    continue
+                
+                # Reading never blocks on busy handlers, so cancellations always get through;
+                # excess load is rejected instead
+                if len(pending) >= self.max_in_flight or not self.admission.try_admit():
+                    await self.reject(request)
+                    continue
+                
+                task = asyncio.create_task(self._dispatch(server, request))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                # Released from a callback rather than inside _dispatch, since a task
+                # cancelled before it first runs never executes its body
+                task.add_done_callback(lambda _: self.admission.release())
+                
+                request_id = request.get("id")
+                if isinstance(request_id, (str, int)):
+                    self.requests[request_id] = task
+                    task.add_done_callback(lambda _, key=request_id: self.requests.pop(key, None))
+            
+            await asyncio.gather(*pending, return_exceptions=True)
+            await self.outbox.join()
+        finally:
+            server.subscriptions.unsubscribe_client(self.notify)
+            writer_task.cancel()
+
+async def open_stdio_channel(admission: Optional[AdmissionQueue] = None) -> MessageChannel:
+    """Open a message channel over stdin/stdout"""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=MAX_MESSAGE_SIZE)
+    
+    try:
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    except (NotImplementedError, ValueError, OSError):
+        # Windows consoles and redirected files can't be watched by the event loop,
+        # so a reader thread feeds the stream instead
+        def pump_stdin():
+            for line in iter(sys.stdin.buffer.readline, b""):
+                loop.call_soon_threadsafe(reader.feed_data, line)
+            loop.call_soon_threadsafe(reader.feed_eof)
+        
+        threading.Thread(target=pump_stdin, daemon=True).start()
+    
+    async def flush_stdout():
+        sys.stdout.buffer.flush()
+    
+    return MessageChannel(reader, sys.stdout.buffer.write, flush_stdout, admission=admission)
+
+async def serve_connections(server, args: argparse.Namespace, admission: AdmissionQueue):
+    """Serve many clients over a Unix or TCP socket, sharing one server instance and admission queue"""
+    async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        channel = MessageChannel(reader, writer.write, writer.drain, admission=admission)
+        try:
+            await channel.serve(server)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+    
+    if args.transport == "unix":
+        if os.path.exists(args.socket_path):
+            os.unlink(args.socket_path)
+        listener = await asyncio.start_unix_server(
+            handle_connection, path=args.socket_path, limit=MAX_MESSAGE_SIZE
+        )
+        logger.info(f"Listening on unix socket {args.socket_path}")
+    else:
+        listener = await asyncio.start_server(
+            handle_connection, args.host, args.port, limit=MAX_MESSAGE_SIZE
+        )
+        logger.info(f"Listening on {args.host}:{args.port}")
+    
+    async with listener:
+        await listener.serve_forever()
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="crypto-liquidity-mcp MCP server")
+    parser.add_argument("--transport", choices=["stdio", "unix", "tcp"], default="stdio",
+                        help="stdio serves a single client; unix/tcp serve many clients from one process")
+    parser.add_argument("--socket-path", default="/tmp/crypto-liquidity-mcp.sock",
+                        help="Socket path for the unix transport")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address for the tcp transport")
+    parser.add_argument("--port", type=int, default=8766, help="Port for the tcp transport")
+    parser.add_argument("--max-concurrent", type=int, default=64,
+                        help="Requests handled at once across all clients")
+    parser.add_argument("--max-queued", type=int, default=256,
+                        help="Requests waiting for a slot before new ones are rejected")
+    return parser.parse_args()
+
+async def main():
+    """Main function to run the MCP server"""
+    args = parse_args()
+    server = LiquidityMCPServer()
+    
+    # Keep one shared session open for the lifetime of the process
+    async with server.provider:
+        server.provider.prefetch.start()
+        try:
+            admission = AdmissionQueue(args.max_concurrent, args.max_queued)
+            if args.transport == "stdio":
+                # Read from stdin, write to stdout
+                channel = await open_stdio_channel(admission)
+                await channel.serve(server)
+            else:
+                await serve_connections(server, args, admission)
+        finally:
+            await server.subscriptions.close()
+            await server.provider.prefetch.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main())
\ No newline at end of file
@@ -16,7 +16,7 @@ if errorlevel 1 (
 
 REM Verificar se as dependências estão instaladas
 echo 🔍 Verificando dependências...
-python -c "import aiohttp, asyncio" >nul 2>&1
+python -c "import aiohttp, asyncio, numpy" >nul 2>&1
 if errorlevel 1 (
     echo 📦 Instalando dependências...
     pip install -r requirements.txt
@@ -15,7 +15,7 @@ fi
 
 # Verificar se as dependências estão instaladas
 echo "🔍 Verificando dependências..."
-if ! python3 -c "import aiohttp, asyncio" &> /dev/null; then
+if ! python3 -c "import aiohttp, asyncio, numpy" &> /dev/null; then
     echo "📦 Instalando dependências..."
     pip3 install -r requirements.txt
 fi
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Checks for the incremental pool refresh and the prefetch scheduler
+
+    python -m unittest test_main
+"""
+
+import asyncio
+import json
+import random
+import time
+import unittest
+
+import main
+
+def pool_record(address: str, liquidity: float) -> dict:
+    """Raw DexScreener-style pool record"""
+    return {
+        "pairAddress": address,
+        "dexId": "uniswap",
+        "baseToken": {"address": "0xaaa", "symbol": "WETH"},
+        "quoteToken": {"address": "0xbbb", "symbol": "USDC"},
+        "liquidity": {"usd": liquidity},
+        "volume": {"h24": 1000},
+        "fees": {"h24": 3},
+        "priceChange": {"h24": 1.5}
+    }
+
+def pool_fields(pools):
+    """Comparable field values of merged pools, by pair address"""
+    return {p.pair_address.lower(): (p.liquidity_usd, p.volume_24h, p.fees_24h, p.apy, p.sources) for p in pools}
+
+class IncrementalParseTest(unittest.TestCase):
+    def test_malformed_records_are_skipped(self):
+        provider = main.LiquidityDataProvider()
+        records = [
+            pool_record("0xA1", 5000),
+            None,
+            dict(pool_record("0xA2", 0), liquidity=[1, 2]),
+            dict(pool_record("0xA3", 0), liquidity={"usd": [1, 2]}),
+            pool_record(123, 100),
+            pool_record("0xA4", 7000)
+        ]
+
+        pools, changed = provider.parse_pool_data_incremental(records, "ethereum", "dexscreener")
+        self.assertEqual(set(pools), {"0xa1", "0xa4"})
+        self.assertEqual(changed, {"0xa1", "0xa4"})
+
+        # Unchanged records are reused on the next refresh
+        again, changed = provider.parse_pool_data_incremental(records, "ethereum", "dexscreener")
+        self.assertEqual(changed, set())
+        self.assertIs(again["0xa1"], pools["0xa1"])
+
+class IncrementalMergeTest(unittest.TestCase):
+    def test_refresh_matches_a_full_merge(self):
+        provider = main.LiquidityDataProvider()
+        rng = random.Random(5)
+        dexscreener = [pool_record(f"0xd{i}", 1000 + i) for i in range(200)]
+        coingecko = [pool_record(f"0xd{i}", 0) for i in range(150, 250)]
+        raw = {"dexscreener": dexscreener, "coingecko": coingecko}
+
+        async def fetch_network_data(network):
+            return {source: list(records) for source, records in raw.items()}
+
+        provider.fetch_network_data = fetch_network_data
+        previous = asyncio.run(provider.refresh_network("ethereum"))
+        for _ in range(5):
+            # Change, drop and add pairs in both sources
+            for records in raw.values():
+                for i in rng.sample(range(len(records)), 10):
+                    records[i] = pool_record(records[i]["pairAddress"], rng.uniform(0, 1e6))
+                del records[rng.randrange(len(records))]
+            dexscreener.append(pool_record(f"0xe{rng.randrange(10 ** 6)}", 10))
+            reported = {r["pairAddress"] for r in coingecko}
+            coingecko.append(pool_record(rng.choice([r["pairAddress"] for r in dexscreener
+                                                     if r["pairAddress"] not in reported]), 20))
+
+            snapshot = asyncio.run(provider.refresh_network("ethereum"))
+            full = main.LiquidityDataProvider()
+            expected = full.merge_pools({
+                source: {p.pair_address.lower(): p for p in full.parse_pool_data(records, "ethereum", source)}
+                for source, records in raw.items()
+            })
+            self.assertEqual(pool_fields(snapshot.pools), pool_fields(expected.values()))
+            self.assertEqual(snapshot.changes.added, set(snapshot.pool_keys) - set(previous.pool_keys))
+            self.assertEqual(snapshot.changes.removed, set(previous.pool_keys) - set(snapshot.pool_keys))
+            previous = snapshot
+
+class SharedRefreshTest(unittest.TestCase):
+    def test_request_after_an_abandoned_refresh_starts_a_new_one(self):
+        provider = main.LiquidityDataProvider()
+        started = []
+
+        async def refresh_network(network):
+            started.append(network)
+            await asyncio.sleep(0.05)
+            return network
+
+        provider.refresh_network = refresh_network
+
+        async def run():
+            abandoned = asyncio.ensure_future(provider.get_pool_snapshot("ethereum"))
+            await asyncio.sleep(0.01)
+            abandoned.cancel()
+            # Let the only waiter give up, cancelling the refresh, then ask again
+            # before the cancellation has unwound
+            await asyncio.sleep(0)
+            return await provider.get_pool_snapshot("ethereum")
+
+        self.assertEqual(asyncio.run(run()), "ethereum")
+        self.assertEqual(started, ["ethereum", "ethereum"])
+
+class PrefetchSchedulerTest(unittest.TestCase):
+    def test_hit_counts_are_dropped_with_demand(self):
+        scheduler = main.LiquidityDataProvider().prefetch
+        for i in range(100):
+            scheduler.record(f"unknown-{i}", "pools", False)
+        scheduler.record("ethereum", "pools", True)
+        scheduler.record("ethereum", "pools", False)
+        self.assertEqual(scheduler.hit_rate("ethereum"), 0.5)
+
+        # Long after the last request only the scores (and counts) that still matter remain
+        scheduler.record("ethereum", "pools", True)
+        scores = scheduler.network_scores(time.time() + scheduler.half_life * 7)
+        self.assertEqual(set(scores), {"ethereum"})
+        self.assertEqual(set(scheduler.hits) | set(scheduler.misses), {"ethereum"})
+
+def serve_lines(channel_admission, lines):
+    """Serve one client whose requests all arrive in a single buffer, returning its responses"""
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"".join(json.dumps(line).encode() + b"\n" for line in lines))
+        reader.feed_eof()
+        written = []
+
+        async def drain():
+            pass
+
+        channel = main.MessageChannel(reader, written.append, drain, admission=channel_admission)
+        await channel.serve(main.LiquidityMCPServer())
+        return [json.loads(line) for line in b"".join(written).splitlines()]
+
+    return asyncio.run(run())
+
+class AdmissionTest(unittest.TestCase):
+    def test_requests_cancelled_before_starting_release_their_slot(self):
+        admission = main.AdmissionQueue(max_active=2, max_queued=2)
+        lines = []
+        for i in range(10):
+            lines.append({"jsonrpc": "2.0", "id": i, "method": "tools/list"})
+            lines.append({"jsonrpc": "2.0", "method": "notifications/cancelled", "params": {"requestId": i}})
+
+        # Requests beyond the queue are rejected, but none is answered after its cancellation
+        responses = serve_lines(admission, lines)
+        self.assertFalse([r for r in responses if "result" in r])
+        self.assertEqual(admission.admitted, 0)
+
+        responses = serve_lines(admission, [{"jsonrpc": "2.0", "id": 99, "method": "tools/list"}])
+        self.assertEqual(responses[0]["id"], 99)
+        self.assertIn("result", responses[0])
+
+class SubscriptionTest(unittest.TestCase):
+    def test_pollers_ignore_the_deadline_of_the_subscribe_request(self):
+        deadlines = []
+
+        async def fetch(resource):
+            deadlines.append(main.request_deadline.get())
+            return None
+
+        async def notify(message):
+            pass
+
+        async def run():
+            manager = main.SubscriptionManager(fetch, "price", "notifications/test", poll_interval=0.01)
+            main.request_deadline.set(asyncio.get_running_loop().time() + 0.05)
+            manager.subscribe(["a"], 0, notify)
+            await asyncio.sleep(0.1)
+            await manager.close()
+
+        asyncio.run(run())
+        self.assertTrue(deadlines)
+        self.assertEqual(set(deadlines), {None})
+
+if __name__ == "__main__":
+    unittest.main()